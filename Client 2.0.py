@@ -1,13 +1,12 @@
 import os
-import re
 import sys
+import time
 import socket
 import argparse
-import time
-from exceptions import *
+import atexit
+from ftpcore import FTPSession
+from ftpcore.network import split_host
 
-PASSIVE = False
-UNITS = ['B/s', 'KB/s', 'MB/s', 'GB/s']
 WELCOME = '''
  _      _____ _     ____  ____  _      _____
 / \  /|/  __// \   /   _\/  _ \/ \__/|/  __/
@@ -32,8 +31,8 @@ ___________________█▄▄█_█░░▀░░┬░░▀░░█_█▄
 | '--------------' || '--------------' || '--------------' |
  '----------------'  '----------------'  '----------------' '''
 
-if sys.version_info < (3, 4):
-    print('Use python >= 3.4', file=sys.stderr)
+if sys.version_info < (3, 5):
+    print('Use python >= 3.5', file=sys.stderr)
     sys.exit()
 
 __version__ = '2.0'
@@ -44,390 +43,540 @@ def parse_data():
     parser = argparse.ArgumentParser(prog='FTPclient.py',
                                      description='''FTP-client connects to FTP server''',
                                      epilog='Author: {}'.format(__author__))
-    parser.add_argument('address', help='Address to connect with FTP server')
+    parser.add_argument('address', help='Address to connect with FTP server', nargs='?')
     parser.add_argument('port', help='Connection port', nargs='?', type=int, default=21)
     parser.add_argument('-l', metavar='name', default='anonymous',
                         help='Your username')
     parser.add_argument('-p', metavar='password', default='example@mail.com',
                         help='Your password')
+    family = parser.add_mutually_exclusive_group()
+    family.add_argument('-4', dest='family', action='store_const', const=socket.AF_INET,
+                        default=socket.AF_UNSPEC, help='Connect over IPv4 only')
+    family.add_argument('-6', dest='family', action='store_const', const=socket.AF_INET6,
+                        help='Connect over IPv6 only')
     parser.add_argument('--passive', help='Use passive mode instead of active', action='store_true')
+    parser.add_argument('--lockstep', action='store_true',
+                        help='Wait for every reply before sending the next command')
+    parser.add_argument('--no-compress', action='store_true',
+                        help='Do not use MODE Z even if the server offers it')
+    parser.add_argument('--copy', action='store_true',
+                        help='Copy data through Python buffers instead of zero-copy I/O')
+    parser.add_argument('--progress', choices=['tty', 'quiet', 'json'],
+                        help='How transfer progress is reported (tty when run in a terminal)')
+    parser.add_argument('--limit', metavar='rate',
+                        help='Overall bandwidth limit, e.g. 500K or 2M')
+    parser.add_argument('--segments', metavar='N', type=int, default=1,
+                        help='Number of parallel connections used to download a file')
+    parser.add_argument('--verify', choices=['crc32', 'md5', 'sha256'],
+                        help='Check every get/put against a checksum computed during the transfer')
+    parser.add_argument('--metrics', metavar='file',
+                        help='Write session metrics as JSON into the file at exit')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--cat', metavar='remote',
+                       help='Write a remote file to standard output and exit')
+    group.add_argument('--store', metavar='remote',
+                       help='Store standard input as a remote file and exit')
+    parser.add_argument('--batch', metavar='manifest',
+                        help='Run the transfers listed in a CSV or JSON file and exit')
+    parser.add_argument('--workers', metavar='N', type=int,
+                        help='Number of transfers run at once in batch mode (4 by default)')
+    parser.add_argument('--probe', metavar='hosts',
+                        help='Check every server in the file (connect, banner, login, listing) '
+                             'and print them ranked by latency')
+    parser.add_argument('--report', metavar='file',
+                        help='Also write the probe results as JSON into the file')
+    parser.add_argument('--stage-timeout', metavar='seconds', type=float,
+                        help='Time each probe stage may take (5 s to connect and greet, '
+                             '10 s to log in and list by default)')
     parser.add_argument('-version', action='version', version=__version__,
                         help='Help you to find out the version of program')
-    # group = parser.add_mutually_exclusive_group()
-    # group.add_argument('-d', metavar='download', help='Download file')
-    # group.add_argument('-u', metavar='upload', help='Upload your file')
-    # print(vars(parser.parse_args()))
     return parser.parse_args()
 
 
-def run(control_sock, data_sock):
+def run(session):
     while True:
         try:
             message = input('>>')
             query = message.split(' ')
             command = query[0].lower()
             argument = query[1] if len(query) > 1 else None
-            option = query[2] if len(query) > 2 else None
+            option = ' '.join(query[2:]) if len(query) > 2 else None
             comm = FUNCTIONS.get(command, invalid)
-            result = comm(control_sock, data_sock, argument, option)
-            if result is not None and result is socket:
-                data_sock = result
+            comm(session, argument, option)
         except ConnectionError as error:
             raise error
         except Exception as error:
             print(error)
 
 
-def login(control_sock, name, passw):
+def run_batch(args, session):
+    # host, direction, remote, local per job; nothing is asked on the terminal
+    from ftpcore.batch import load_manifest, run_jobs, summary, route, WORKERS
+    jobs = load_manifest(args.batch, args.address, args.port, args.l, args.p)
+    start_time = time.time()
+
+    def report(job, error, count, seconds):
+        print('{} {} {} -> {}: {}'.format('FAIL' if error else 'ok', job.direction, *route(job),
+                                          str(error).strip() if error
+                                          else '{} bytes in {:.1f} s'.format(count, seconds)))
+
+    workers = WORKERS if args.workers is None else max(args.workers, 1)
+    results = run_jobs(session.session_pool(), jobs, workers, session.scheduler, report,
+                       session.passive)
+    session.close()
+    text, success = summary(results, time.time() - start_time)
+    print(text)
+    return success
+
+
+def run_probe(args):
+    # the port and login given on the command line apply to every server in the list
+    from ftpcore.probe import load_hosts, probe_all, summary, export, TIMEOUTS, WORKERS
+    hosts = load_hosts(args.probe, args.port)
+    timeouts = TIMEOUTS
+    if args.stage_timeout:
+        timeouts = dict((stage, args.stage_timeout) for stage in TIMEOUTS)
+    start_time = time.time()
+    results = probe_all(hosts, args.l, args.p, args.workers or WORKERS, timeouts,
+                        args.passive, args.family)
+    seconds = time.time() - start_time
+    text, success = summary(results, seconds)
+    print(text)
+    if args.report:
+        export(results, args.report, round(seconds, 3))
+    return success
+
+
+def run_stream(args, session):
+    # data goes through stdout or stdin and messages to stderr, so the client can sit in a pipeline
+    import shutil
+    from ftpcore.stream import open_remote
+    from ftpcore.datapath import CHUNK_SIZE
+    try:
+        session.connect()
+        session.login(args.l, args.p)
+        compress = session.compress and 'MODE Z' in session.features()
+        if args.cat:
+            with open_remote(session.sock, args.cat, 'rb', compress,
+                             passive=session.passive) as remote:
+                shutil.copyfileobj(remote, sys.stdout.buffer, CHUNK_SIZE)
+            sys.stdout.buffer.flush()
+        else:
+            with open_remote(session.sock, args.store, 'wb', compress,
+                             passive=session.passive) as remote:
+                shutil.copyfileobj(sys.stdin.buffer, remote, CHUNK_SIZE)
+    except BrokenPipeError:
+        # the reader has had enough, like with `| head`
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    except (OSError, ValueError) as error:
+        print(str(error).strip(), file=sys.stderr)
+        return False
+    finally:
+        session.quit()
+    return True
+
+
+def login(session, name, passw):
     if name is None:
         name = input('Enter your username: ')
-    control_sock.sendall(bytes('USER {}\r\n'.format(name), 'ASCII'))
-    receive_answer(control_sock)
-    # print(reply)
     if passw is None:
         passw = input('Enter your password: ')
-    control_sock.sendall(bytes('PASS {}\r\n'.format(passw), 'ASCII'))
-    reply = receive_answer(control_sock)
-    # print(reply)
-    if not re.match(r'2\d\d', reply):
+    try:
+        session.login(name, passw)
+    except ValueError:
         raise ValueError('Login is incorrect. '
                          'Sorry but you cannot work with me :( Try again')
 
 
-def receive_answer(sock):
-    reply = ''
-    tmp = sock.recv(65535).decode('ASCII')
-    reply += tmp
-    ans_reg = re.compile(r'^\d\d\d .*$', re.MULTILINE)
-    while not re.findall(ans_reg, tmp):
-        try:
-            tmp = sock.recv(65535).decode('ASCII')
-            reply += tmp
-        except TimeoutError:
-            break
-        except Exception as error:
-            print(error)
-            break
-    return reply
+def get(session, file_to_load, local_file):
+    if file_to_load is None:
+        raise ValueError("You don\'t specify remote file name")
+    print(session.get(file_to_load, local_file))
 
 
-def receive_full_data(sock):
-    reply = b''
-    sock.settimeout(2)
-    while True:
-        try:
-            tmp = sock.recv(65535)
-            if not tmp:
-                break
-        except TimeoutError:
-            break
-        finally:
-            reply += tmp
-            return reply
+def cat(session, remote_name, extra_arg):
+    if remote_name is None:
+        raise ValueError("You don\'t specify remote file name")
+    session.cat(remote_name, sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+    print()
 
 
-def get(control_sock, data_sock, file_to_load, local_file):
+def put(session, local_file, remote_name):
+    if local_file is None:
+        raise ValueError("Please specify local file name")
+    print(session.put(local_file, remote_name))
+
+
+def mget(session, argument, option):
+    # mget $file... ; names with * or ? are matched in their remote directory
+    import fnmatch
+    import posixpath
+    if argument is None:
+        raise ValueError("You don\'t specify remote file names")
+    names = [argument] + option.split() if option else [argument]
+    remote_files = []
+    for name in names:
+        if not any(char in name for char in '*?['):
+            remote_files.append(name)
+            continue
+        folder, pattern = posixpath.split(name)
+        remote_files.extend(posixpath.join(folder, entry.name)
+                            for entry in session.listing(folder or None)
+                            if entry.type == 'file' and fnmatch.fnmatch(entry.name, pattern))
+    print_batch('Downloaded', session.get_many(remote_files))
+
+
+def mput(session, argument, option):
+    # mput $file... ; local names are expanded like in a shell
+    import glob
+    if argument is None:
+        raise ValueError("Please specify local file names")
+    names = [argument] + option.split() if option else [argument]
+    local_files = [path for name in names for path in sorted(glob.glob(name))
+                   if os.path.isfile(path)]
+    print_batch('Uploaded', session.put_many(local_files))
+
+
+def print_batch(action, stats):
+    from ftpcore.progress import convert_speed
+    for path, error in stats['errors']:
+        print('{}: {}'.format(path, str(error).strip()))
+    seconds = max(stats['seconds'], 1e-6)
+    print('{} {} files ({} bytes) in {:.1f} s: {:.1f} files/s, {}'
+          .format(action, stats['files'], stats['bytes'], seconds, stats['files'] / seconds,
+                  convert_speed(stats['bytes'] / seconds)))
+
+
+def reget(session, file_to_load, local_file):
     if file_to_load is None:
         raise ValueError("You don\'t specify remote file name")
-    if local_file is None:
-        local_file = '{}\{}'.format(os.getcwd(), os.path.basename(file_to_load))
-    switch_type(control_sock, None, 'I', None)
+    reply = session.reget(file_to_load, local_file)
+    if reply is not None:
+        print(reply)
 
-    file_size = size(control_sock, None, file_to_load, None)
-    if not PASSIVE:
-        sock = port(control_sock)
-    else:
-        data_sock = pasv(control_sock)
-    send(control_sock, 'RETR', file_to_load)
-    reply = receive_answer(control_sock)
-    # print(reply)
-
-    if not reply.startswith('150'):
-        raise FileNotFoundError('Couldn\'t download file {}'.format(file_to_load))
-    if not PASSIVE:
-        data_sock, address = sock.accept()
-    with open(local_file, 'wb') as result:
-        received = 0
-        start_time = time.time()
-        while file_size > received:
-            data = data_sock.recv(65535)
-            if not data:
-                break
-            result.write(data)
-            received += len(data)
-            print_progress(received, file_size, start_time, time.time())
-    data_sock.close()
-    reply = receive_answer(control_sock)
-    print(reply)
-
-
-def put(control_sock, data_sock, local_file, remote_name):
+
+def reput(session, local_file, remote_name):
     if local_file is None:
         raise ValueError("Please specify local file name")
-    if remote_name is None:
-        remote_name = os.path.basename(local_file)
-    switch_type(control_sock, None, 'I', None)
-    if not PASSIVE:
-        sock = port(control_sock)
-    else:
-        data_sock = pasv(control_sock)
-    send(control_sock, 'STOR', remote_name)
-    reply = receive_answer(control_sock)
-    # print(reply)
-    if reply[0] == '5':
-        print('You have no permission to store the file. Please, relogin')
+    reply = session.reput(local_file, remote_name)
+    if reply is not None:
+        print(reply)
+
+
+def pasv(session, argument, extra_arg):
+    session.passive = True
+    print('Data connections are opened with PASV')
+
+
+def port(session, argument, extra_arg):
+    session.passive = False
+    print('Data connections are opened with PORT')
+
+
+def dir_list(session, argument, extra_arg):
+    if argument is not None and argument.lower() == '-r':
+        walk(session, session.working_dir())
         return
-    if not PASSIVE:
-        data_sock, address = sock.accept()
-    with open(local_file, 'rb') as file:
-        sent = 0
-        file_size = os.path.getsize(local_file)
-        start_time = time.time()
-        while file_size > sent:
-            data = file.read(65535)
-            data_sock.sendall(data)
-            sent += len(data)
-            print_progress(sent, file_size, start_time, time.time())
-    data_sock.close()
-    reply = receive_answer(control_sock)
-    print(reply)
-
-
-def pasv(control_sock, data_sock=None, argument=None, extra_arg=None):
-    send(control_sock, 'PASV')
-    reply = receive_answer(control_sock)
-    print(reply)
-    reg = r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)'
-    numbs = re.findall(reg, reply)[0]
-    if not numbs:
-        print('Passive mode is not available now')
-        print('Try later')
-        sys.exit(0)
-    ip_address = '.'.join(numbs[:4])
-    port = int(numbs[4]) * 256 + int(numbs[5])
-    data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    entries = session.listing(argument)
+    if extra_arg:
+        # ls $dir size: biggest first, time: newest first
+        from ftpcore.listing import SORT_KEYS
+        if extra_arg not in SORT_KEYS:
+            raise ValueError('Sort by one of: {}'.format(', '.join(SORT_KEYS)))
+        entries = entries.sort(extra_arg, extra_arg in ('size', 'time'))
+    print_entries(entries)
+
+
+def walk(session, path):
+    entries = session.listing(path)
+    print('{}:'.format(path))
+    print_entries(entries)
+    for entry in entries:
+        if entry.type == 'dir':
+            walk(session, '{}/{}'.format(path.rstrip('/'), entry.name))
+
+
+def print_entries(entries):
+    for entry in entries:
+        print('{:<5} {:>12} {:<17} {}'.format(entry.type,
+                                             '' if entry.size is None else entry.size,
+                                             entry.modify or '', entry.name))
+
+
+def copy(session, argument, option):
+    # copy $file ftp://[user[:password]@]host[:port]/path ; the servers send the data to each other
+    from urllib.parse import urlsplit, unquote
+    if argument is None or option is None:
+        raise ValueError('Please specify the file and the server to copy it to')
+    url = urlsplit(option if '://' in option else 'ftp://' + option)
+    target_name = unquote(url.path) or None
+    if target_name is None or target_name.endswith('/'):
+        target_name = (target_name or '') + argument.rstrip('/').rsplit('/', 1)[-1]
+    target = FTPSession(url.hostname, url.port or 21, family=session.family)
+    start_time = time.time()
     try:
-        data_sock.connect((ip_address, port))
-    except ConnectionError as error:
-        print(error)
-    except Exception as error:
-        print(error)
-    PASSIVE = True
-    return data_sock
-
-
-def port(control_sock, data_sock=None, argument=None, extra_argument=None):
-    # socket’s own address
-    ip_address = control_sock.getsockname()[0]
-    sock = socket.socket()
-    sock.bind(('', 0))
-    sock.listen()
-    local_port = sock.getsockname()[1]
-    port_int, port_modulo = local_port // 256, local_port % 256
-    query = 'PORT {},{},{}'.format(ip_address.replace('.', ','), port_int, port_modulo)
-    send(control_sock, query)
-    reply = receive_answer(control_sock)
-    print(reply)
-    if not reply.startswith('2'):
-        print('Active mode is not available. Try passive')
-    return sock
-
-
-def dir_list(control_sock, data_sock=None, argument=None, extra_arg=None):
-    if not PASSIVE:
-        sock = port(control_sock)
-    else:
-        data_sock = pasv(control_sock)
-    send(control_sock, 'LIST')
-    reply = receive_answer(control_sock)
-    print(reply)
-    if not PASSIVE:
-        data_sock, address = sock.accept()
-    if data_sock is None:
-        raise ConnectionError('Data connection is required')
-    data = receive_full_data(data_sock).decode('UTF-8')
-    print(data)
-    data_sock.close()
-    reply = receive_answer(control_sock)
-    print(reply)  # 226 Transfer complete
-    if argument is not None and argument.lower() == '-r':
-        reg = re.compile(r' (\.|\w+)+?\r\n')
-        result = re.findall(reg, data)
-        for folder in result:
-            try:
-                cwd(control_sock, data_sock, folder, True)
-            except NotChangedDirectoryError as e:
-                continue
-            pwd(control_sock, data_sock, True, None)
-            dir_list(control_sock, data_sock, '-r', None)
-        curr_folder = pwd(control_sock, data_sock, True, None)
-        dir = re.findall(r'\"(.+)\"', curr_folder)[0].split('/')
-        new_dir = '/'.join(dir[:len(dir) - 1])
-        cwd(control_sock, None, '/' + new_dir, True)
-
-
-def convert_speed(speed):
-    unit_index = 0
-    while speed > 1024:
-        speed /= 1024
-        unit_index += 1
-    return '{:.1f}{}'.format(speed, UNITS[unit_index])
-
-
-def print_progress(done, total, start_time, current):
-    percent = "{0:.1%}".format(done / total)
-    filled_length = int(round(done / float(total) * 20))
-    bar = '█' * filled_length + '_' * (20 - filled_length)
-
-    speed = done / (current - start_time + 1)
-    expected_time = int((total - done) / speed)
-    sys.stdout.write('\rProgress: [{}] {} complete; '
-                     'speed:{}; '
-                     '{} seconds left'
-                     .format(bar,
-                             percent,
-                             convert_speed(speed),
-                             expected_time))
-    if done == total:
-        sys.stdout.write('\n\n')
-    sys.stdout.flush()
-
-
-def send(sock, command, argument=None):
-    if argument is not None:
-        query = '{} {}\r\n'.format(command, argument)
+        target.connect()
+        target.login(unquote(url.username or 'anonymous'),
+                     unquote(url.password or 'example@mail.com'))
+        size = session.copy_to(target, argument, target_name)
+    finally:
+        target.quit()
+    print('Copied {} to {}:{}{} in {:.1f} s{}'.format(
+        argument, url.hostname, url.port or 21, target_name, time.time() - start_time,
+        '' if size is None else ', {} bytes'.format(size)))
+
+
+def mirror_dir(session, remote_dir, local_dir):
+    from ftpcore.mirror import mirror, WORKERS
+    from ftpcore.progress import convert_speed
+    remote_dir = session.remote_path(remote_dir)
+    if local_dir is None:
+        local_dir = os.path.join(os.getcwd(), os.path.basename(remote_dir.rstrip('/')) or 'mirror')
+    stats = mirror(session.session_pool(), session.host, session.port, session.user,
+                   session.password, remote_dir, local_dir, max(session.segments, WORKERS),
+                   'MLST' in session.features(), session.cache, session.scheduler,
+                   session.compress and 'MODE Z' in session.features(), session.passive)
+    for path, error in stats['errors']:
+        print('{}: {}'.format(path, error))
+    seconds = max(stats['seconds'], 1e-6)
+    print('Mirrored {} files ({} bytes) into {} in {:.1f} s: {:.1f} files/s, {}'
+          .format(stats['files'], stats['bytes'], local_dir, seconds,
+                  stats['files'] / seconds, convert_speed(stats['bytes'] / seconds)))
+
+
+def sync_dir(session, direction, options):
+    # sync down|up $dir [$local] [-n] [--delete]
+    from ftpcore.mirror import WORKERS
+    from ftpcore.sync import sync
+    options = options.split() if options else []
+    flags = [option for option in options if option.startswith('-')]
+    paths = [option for option in options if not option.startswith('-')]
+    if direction is None or not paths:
+        raise ValueError('Use: sync down|up $dir [$local] [-n] [--delete]')
+    remote_dir = session.remote_path(paths[0])
+    local_dir = paths[1] if len(paths) > 1 else \
+        os.path.join(os.getcwd(), os.path.basename(remote_dir.rstrip('/')) or 'sync')
+    login = (session.host, session.port, session.user, session.password)
+    stats = sync(session.session_pool(), login, direction.lower(), remote_dir, local_dir,
+                 '-n' in flags, '--delete' in flags, 'MLST' in session.features(),
+                 session.cache, max(session.segments, WORKERS), session.scheduler, print_plan,
+                 session.passive)
+    if stats is None:
+        return
+    for path, error in stats['errors']:
+        print('{}: {}'.format(path, error))
+    print('Transferred {} files ({} bytes) in {:.1f} s'
+          .format(stats['files'], stats['bytes'], stats['seconds']))
+
+
+def print_plan(actions):
+    from ftpcore.sync import KINDS
+    for action in actions:
+        if action.kind != 'unchanged':
+            print('{:<10}{}'.format(action.kind, action.path))
+    print(', '.join('{} {}'.format(sum(1 for action in actions if action.kind == kind), kind)
+                    for kind in KINDS))
+
+
+def limit(session, scope, rate):
+    # limit [global|host|transfer|$hostname|$transfer_id] $rate
+    from ftpcore.bandwidth import parse_rate
+    scheduler = session.limiter()
+    if scope is None:
+        limits = scheduler.limits()
+        print('global: {}; per host: {}; per transfer: {}; priority: {}'.format(
+            show_rate(limits['global']), show_rate(scheduler.host_rate),
+            show_rate(limits['transfer']), session.priority))
+        for host, host_rate in limits['hosts'].items():
+            print('  {}: {}'.format(host, show_rate(host_rate)))
+        for stream_id, (host, priority, stream_rate) in limits['active'].items():
+            print('  #{} {} priority {}: {}'.format(stream_id, host, priority,
+                                                    show_rate(stream_rate)))
+        return
+    if scope.lower() == 'priority':
+        session.priority = max(int(rate), 1)
+        return
+    if rate is None:
+        scope, rate = 'global', scope
+    scheduler.set_limit(scope.lower() if scope.lower() in ('global', 'host', 'transfer')
+                        else scope, parse_rate(rate))
+
+
+def stats(session, mode, extra_arg):
+    # stats [json|reset]
+    if mode is not None and mode.lower() == 'reset':
+        session.metrics.reset()
+    elif mode is not None and mode.lower() == 'json':
+        import json
+        print(json.dumps(session.metrics.snapshot(), indent=2, sort_keys=True))
     else:
-        query = '{}\r\n'.format(command)
-    sock.sendall(bytes(query, 'ASCII'))
+        print(session.metrics.report())
 
 
-def size(control_sock, data_sock, filename, path_value):
-    if filename is None:
-        raise ValueError('You don\'t specify file name')
-    send(control_sock, 'SIZE', filename)
-    reply = receive_answer(control_sock)
-    reg = r' (\d+)'
-    result = re.findall(reg, reply)
-    return int(result[0])
+def show_rate(rate):
+    from ftpcore.progress import convert_speed
+    return 'unlimited' if rate is None else convert_speed(rate)
 
 
-"""
-def print_size(control_sock, data_sock, filename, path_value):
-    number = size(control_sock, data_sock, filename, path_value)
-    print('The size of \'{}\' is {}'.format(filename, number))
-"""
+def set_progress(session, kind, extra_arg):
+    from ftpcore.progress import make_sink
+    session.sink = make_sink(kind)
+    print('Progress is reported with {}'.format(type(session.sink).__name__))
 
 
-def switch_type(control_sock, data_sock, name, extra_arg):
-    send(control_sock, 'TYPE', name)
-    reply = receive_answer(control_sock)
-    # print(reply)
+def set_segments(session, number, extra_arg):
+    if number is None:
+        print('Files are downloaded in {} segment(s)'.format(session.segments))
+        return
+    if int(number) < 1:
+        raise ValueError('Number of segments should be positive')
+    session.segments = int(number)
 
 
-def connect(address, port):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(2)
-    try:
-        address = socket.getaddrinfo(address, port)
-        sock.connect(address[0][4])
-    except socket.gaierror as error:
-        raise ConnectionError('Address fetching failed: {}:{}'.format(address, port))
-    except Exception as error:
-        raise ConnectionError('Connection error: ' + str(error))
-    return sock
+def set_verify(session, algorithm, extra_arg):
+    from ftpcore.checksum import Digest
+    if algorithm is not None:
+        session.verify = None if algorithm.lower() == 'off' else \
+            Digest(algorithm.lower()).algorithm
+    print('Transfers are {}'.format('checked with ' + session.verify if session.verify
+                                    else 'not checked'))
+
+
+def set_compress(session, mode, extra_arg):
+    if mode is not None:
+        session.compress = mode.lower() == 'on'
+    print('MODE Z is {}, the server {}'.format(
+        'on' if session.compress else 'off',
+        'offers it' if 'MODE Z' in session.features() else 'does not offer it'))
+
+
+def set_zero_copy(session, mode, extra_arg):
+    if mode is not None:
+        session.zero_copy = mode.lower() == 'on'
+    print('Zero-copy transfers are {}'.format('on' if session.zero_copy else 'off'))
 
 
-def disconnect(control_sock, data_sock=None, argument=None, extra_arg=None):
-    send(control_sock, 'QUIT')
-    reply = receive_answer(control_sock)
-    # print(reply)
-    # print('See ya next time :)')
+def set_pipeline(session, mode, extra_arg):
+    if mode is not None:
+        session.pipelining = mode.lower() == 'on'
+    print('Command pipelining is {}'.format('on' if session.pipelining else 'off'))
+
+
+def size(session, filename, extra_arg):
+    if filename is None:
+        raise ValueError('You don\'t specify file name')
+    number = session.size(filename)
+    if number is None:
+        raise FileNotFoundError('Couldn\'t get size of {}'.format(filename))
+    print('The size of \'{}\' is {}'.format(filename, number))
+
+
+def switch_type(session, name, extra_arg):
+    session.set_type(name)
+
+
+def disconnect(session, argument=None, extra_arg=None):
+    session.quit()
     print(BYE)
     sys.exit(0)
 
 
 def main():
     args = parse_data()
-    if args.passive:
-        global PASSIVE
-        PASSIVE = True
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(10)
-    print('Connecting to {}:{}'.format(args.address, args.port))
+    if args.address is not None:
+        # host:port and [v6]:port win over the port argument
+        args.address, args.port = split_host(args.address, args.port)
+    if args.probe:
+        sys.exit(0 if run_probe(args) else 1)
+    from ftpcore.listing import DirCache
+    from ftpcore.progress import make_sink
+    session = FTPSession(args.address, args.port, passive=args.passive, cache=DirCache(),
+                         sink=make_sink(args.progress), notify=print, family=args.family)
+    session.pipelining = not args.lockstep
+    session.zero_copy = not args.copy
+    session.compress = not args.no_compress
+    session.segments = max(args.segments, 1)
+    session.verify = args.verify
+    if args.limit:
+        from ftpcore.bandwidth import parse_rate
+        session.limiter().set_limit('global', parse_rate(args.limit))
+    if args.metrics:
+        atexit.register(session.metrics.export, args.metrics)
+    if args.batch:
+        sys.exit(0 if run_batch(args, session) else 1)
+    if args.address is None:
+        print('Address of FTP server is required', file=sys.stderr)
+        sys.exit(2)
+    if args.cat or args.store:
+        # data and replies must not mix on stdout
+        session.notify = None
+        sys.exit(0 if run_stream(args, session) else 1)
+    print(('Connecting to [{}]:{}' if ':' in args.address else 'Connecting to {}:{}')
+          .format(args.address, args.port))
     # Присоединяемся к серверу
-    sock.connect((args.address, args.port))
-    reply = receive_answer(sock)
-    print(reply)
     try:
-        data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        data_sock.connect((args.address, args.port))
-        login(sock, args.l, args.p)
-    except ConnectionError as error:
-        print('Connection failed')
+        print(session.connect())
+        login(session, args.l, args.p)
+    except OSError as error:
+        print('Connection failed: {}'.format(error))
         sys.exit(1)
     except Exception as error:
         print(error)
-        disconnect(sock)
+        disconnect(session)
     print('The login with username \"' + args.l + '\" was successful')
     print(WELCOME)
     print('Print \"?\" to show available commands')
-    run(sock, data_sock)
-    '''
-    data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    data_sock.connect((args.address, args.port))
-    data = b''
-    with open('downloaded', 'wb') as result:
-        data = data_sock.recv(1024)
-        while data:
-            result.write(data)
-            # Читаем данные от сервера, но не более 1024 байт
-            data = data_sock.recv(1024)
-    # Закрываем соединение
-    data_sock.close()
-    sock.close()
-'''
-
-
-def cwd(control_sock, data_sock, path, extra_arg):
-    send(control_sock, 'CWD', path)
-    reply = receive_answer(control_sock)
-    if not reply.startswith('2'):
-        raise NotChangedDirectoryError('Cannot change directory')
-
-
-def pwd(control_sock, data_sock, not_print, extra_arg):
-    send(control_sock, 'PWD')
-    reply = receive_answer(control_sock)
-    if not not_print:
-        print(reply)
-    else:
-        return reply
+    run(session)
+
+
+def cwd(session, path, extra_arg):
+    session.change_dir(path)
+
+
+def pwd(session, argument, extra_arg):
+    print(session.pwd())
 
 
-def invalid(arg1, arg2, arg3, arg4):
+def invalid(arg1, arg2, arg3):
     print('Invalid command\nUse "HELP" command or "?" for internal help')
 
 
-def server_help(control_sock, data_sock, argument, extra_arg):
-    send(control_sock, 'HELP')
-    reply = receive_answer(control_sock)
-    print(reply)
+def server_help(session, argument, extra_arg):
+    print(session.command('HELP'))
 
 
-def int_help(arg1, arg2, arg3, arg4):
+def int_help(arg1, arg2, arg3):
     print("""Supported commands:
     Command\tUsing\t\tDescription\t 
     user\tuser $username\tRelogin\t
     quit\tquit\t\tClose FTP-client\t
     help\thelp\t\tSend help request to server\t
-    ls\t\tls\t\tShow current directory\t
+    ls\t\tls [$dir|-r] [$key]\tShow directory (recursively with -r), sorted by name|size|time|type\t
     cd\t\tcd $new_dir\tChange working directory
     pwd\t\tpwd\t\tPrint working directory
     size\tsize $filename\tFind file size\t
     get\t\tget $filename\tDownload file\t
+    cat\t\tcat $filename\tPrint remote file without saving it
     put\t\tput $filename\tSave file (if it is available) 
+    mget\tmget $file...\tDownload many small files at once (* and ? allowed)
+    mput\tmput $file...\tUpload many small files at once
+    mirror\tmirror $dir $local\tDownload directory tree in parallel
+    copy\tcopy $file ftp://host/path\tCopy a file to another server directly (FXP)
+    sync\tsync down|up $dir $local\tTransfer only changed files (-n to preview)
+    reget\treget $filename\tResume interrupted download
+    reput\treput $filename\tResume interrupted upload
     pasv\tpasv\t\tChange mode to the passive
+    port\tport\t\tChange mode to the active
     type\ttype $type\tChange data send mode
+    pipeline\tpipeline on|off\tSend independent commands together
+    zerocopy\tzerocopy on|off\tUse sendfile/recv_into for file data
+    compress\tcompress on|off\tUse MODE Z when the server offers it
+    verify\tverify crc32|md5|sha256|off\tCheck get/put against a checksum
+    limit\tlimit [$scope] $rate\tLimit bandwidth (global, host, transfer, priority)
+    progress\tprogress tty|quiet|json\tChoose progress output
+    segments\tsegments $n\tDownload files over n parallel connections
+    stats\tstats [json|reset]\tShow command latencies and transfer rates
     ?\t\t\t\tShow this help message\t
     """)
 
@@ -441,10 +590,26 @@ FUNCTIONS = {
     'cd': cwd,
     'pwd': pwd,
     'get': get,
+    'cat': cat,
     'put': put,
+    'mget': mget,
+    'mput': mput,
+    'mirror': mirror_dir,
+    'copy': copy,
+    'sync': sync_dir,
+    'reget': reget,
+    'reput': reput,
     'type': switch_type,
     'port': port,
     'pasv': pasv,
+    'pipeline': set_pipeline,
+    'limit': limit,
+    'progress': set_progress,
+    'segments': set_segments,
+    'zerocopy': set_zero_copy,
+    'compress': set_compress,
+    'verify': set_verify,
+    'stats': stats,
     '?': int_help
 }
 
@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import asyncio
+import platform
+import tempfile
+from ftp_server import StandInServer, FAULTS
+from ftpcore.pool import ConnectionPool
+from ftpcore.mirror import list_dir, download, upload, mirror, download_files, spread
+from ftpcore.async_ftp import AsyncFTP, fan_out
+
+__version__ = '1.0'
+
+USER = ('anonymous', 'example@mail.com')
+
+
+def parse_data():
+    parser = argparse.ArgumentParser(prog='benchmark.py',
+                                     description='''Measures the client against a local stand-in server''')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Injected control reply latency in seconds')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='Injected data rate limit in bytes per second')
+    parser.add_argument('--fault', action='append', default=[], choices=FAULTS,
+                        help='Injected server fault')
+    parser.add_argument('--size', type=int, default=64 * 1024 * 1024,
+                        help='Size of the single large file in bytes')
+    parser.add_argument('--text-size', type=int, default=16 * 1024 * 1024,
+                        help='Size of the compressible text file in bytes')
+    parser.add_argument('--files', type=int, default=200,
+                        help='Number of small files')
+    parser.add_argument('--small-size', type=int, default=4096,
+                        help='Size of every small file in bytes')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Repetitions of every measurement')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Sessions used for the small files')
+    parser.add_argument('-o', '--output', metavar='file',
+                        help='Write results as JSON into the file')
+    parser.add_argument('--compare', metavar='file',
+                        help='Compare with earlier JSON results')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative regression when comparing')
+    return parser.parse_args()
+
+
+def prepare(root, args):
+    with open(os.path.join(root, 'large.bin'), 'wb') as file:
+        block = os.urandom(1024 * 1024)
+        written = 0
+        while written < args.size:
+            file.write(block[:args.size - written])
+            written += len(block[:args.size - written])
+    with open(os.path.join(root, 'logs.csv'), 'w') as file:
+        # log-like rows, they compress several times like the real ones
+        written, row = 0, 0
+        while written < args.text_size:
+            line = '{},2024-05-{:02}T{:02}:{:02}:{:02},GET,/static/file{}.js,{},{}\n'.format(
+                row, row % 28 + 1, row % 24, row % 60, row * 7 % 60, row % 500,
+                (200, 200, 304, 404)[row % 4], row * 7919 % 100000)
+            file.write(line)
+            written += len(line)
+            row += 1
+    small = os.path.join(root, 'small')
+    os.mkdir(small)
+    payload = os.urandom(args.small_size)
+    for i in range(args.files):
+        with open(os.path.join(small, 'file{:05}.dat'.format(i)), 'wb') as file:
+            file.write(payload)
+
+
+def timed(action, repeat):
+    timings = []
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - start_time)
+    return sorted(timings)
+
+
+def result(value, unit, better, timings=None):
+    record = {'value': round(value, 4), 'unit': unit, 'better': better}
+    if timings:
+        record['median_s'] = round(timings[len(timings) // 2], 6)
+        record['best_s'] = round(timings[0], 6)
+    return record
+
+
+def run_benchmarks(args):
+    results = {}
+    root = tempfile.mkdtemp(prefix='ftp-bench-')
+    local = tempfile.mkdtemp(prefix='ftp-bench-local-')
+    try:
+        prepare(root, args)
+        with StandInServer(root, latency=args.latency, bandwidth=args.bandwidth,
+                           faults=args.fault) as server:
+            host, port = server.address
+            pool = ConnectionPool(max_per_host=max(args.workers, 1))
+            login = (host, port) + USER
+
+            timings = timed(lambda: pool.quit(pool.open(*login)), args.repeat)
+            results['login'] = result(timings[len(timings) // 2] * 1000, 'ms', 'lower', timings)
+
+            with pool.session(*login) as sock:
+                timings = timed(lambda: list_dir(sock, '/small'), args.repeat)
+                results['listing'] = result(timings[len(timings) // 2] * 1000, 'ms',
+                                            'lower', timings)
+                results['listing']['entries'] = args.files
+
+                target = os.path.join(local, 'large.bin')
+                timings = timed(lambda: download(sock, '/large.bin', target), args.repeat)
+                results['download'] = result(args.size / timings[len(timings) // 2] / 2 ** 20,
+                                             'MB/s', 'higher', timings)
+                timings = timed(lambda: upload(sock, target, '/uploaded.bin'), args.repeat)
+                results['upload'] = result(args.size / timings[len(timings) // 2] / 2 ** 20,
+                                           'MB/s', 'higher', timings)
+
+                text = os.path.join(local, 'logs.csv')
+                text_size = os.path.getsize(os.path.join(root, 'logs.csv'))
+                for name, compress in (('text_download', False), ('text_download_z', True)):
+                    before = server.wire['sent']
+                    timings = timed(lambda: download(sock, '/logs.csv', text, compress=compress),
+                                    args.repeat)
+                    results[name] = result(text_size / timings[len(timings) // 2] / 2 ** 20,
+                                           'MB/s', 'higher', timings)
+                    results[name]['wire_bytes'] = (server.wire['sent'] - before) // args.repeat
+                for name, compress in (('text_upload', False), ('text_upload_z', True)):
+                    before = server.wire['received']
+                    timings = timed(lambda: upload(sock, text, '/uploaded.csv', compress=compress),
+                                    args.repeat)
+                    results[name] = result(text_size / timings[len(timings) // 2] / 2 ** 20,
+                                           'MB/s', 'higher', timings)
+                    results[name]['wire_bytes'] = (server.wire['received'] - before) // args.repeat
+                results['text_wire_saving'] = result(
+                    100 - 100 * results['text_download_z']['wire_bytes'] /
+                    max(results['text_download']['wire_bytes'], 1), '%', 'higher')
+
+                def serial():
+                    for name in sorted(os.listdir(os.path.join(root, 'small'))):
+                        download(sock, '/small/' + name, os.path.join(local, name))
+
+                timings = timed(serial, max(args.repeat // 2, 1))
+                results['small_files_serial'] = result(
+                    args.files / timings[len(timings) // 2], 'files/s', 'higher', timings)
+
+                pairs = [('/small/' + name, os.path.join(local, name))
+                         for name in sorted(os.listdir(os.path.join(root, 'small')))]
+
+                def pipelined():
+                    for pair, count, error in download_files(sock, pairs):
+                        if error is not None:
+                            raise error
+
+                timings = timed(pipelined, max(args.repeat // 2, 1))
+                results['small_files_pipelined'] = result(
+                    args.files / timings[len(timings) // 2], 'files/s', 'higher', timings)
+
+            def parallel():
+                stats = mirror(pool, host, port, USER[0], USER[1], '/small',
+                               os.path.join(local, 'mirror'), args.workers)
+                if stats['errors']:
+                    raise ConnectionError(stats['errors'][0])
+
+            timings = timed(parallel, max(args.repeat // 2, 1))
+            results['small_files_parallel'] = result(
+                args.files / timings[len(timings) // 2], 'files/s', 'higher', timings)
+            results['small_files_parallel']['workers'] = args.workers
+
+            def spread_out():
+                stats = spread(pool, login, pairs, download_files, args.workers)
+                if stats['errors']:
+                    raise ConnectionError(stats['errors'][0])
+
+            timings = timed(spread_out, max(args.repeat // 2, 1))
+            results['small_files_spread'] = result(
+                args.files / timings[len(timings) // 2], 'files/s', 'higher', timings)
+            results['small_files_spread']['workers'] = args.workers
+
+            async def fetch(names):
+                client = AsyncFTP(host, port)
+                await client.connect()
+                await client.login(*USER)
+                try:
+                    for name in names:
+                        await client.get('/small/' + name, os.path.join(local, name))
+                finally:
+                    await client.quit()
+
+            def gathered():
+                # the same files over as many asyncio sessions on one thread
+                names = sorted(os.listdir(os.path.join(root, 'small')))
+                shares = [names[i::args.workers] for i in range(args.workers)]
+                loop = asyncio.new_event_loop()
+                try:
+                    errors = loop.run_until_complete(fan_out(fetch, shares, args.workers))
+                finally:
+                    loop.close()
+                for error in errors:
+                    if error is not None:
+                        raise error
+
+            timings = timed(gathered, max(args.repeat // 2, 1))
+            results['small_files_async'] = result(
+                args.files / timings[len(timings) // 2], 'files/s', 'higher', timings)
+            results['small_files_async']['workers'] = args.workers
+            pool.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(local, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print('{:<24}{:>14}{:>14}{:>10}'.format('benchmark', 'baseline', 'current', 'change'))
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or not previous['value']:
+            continue
+        change = (current['value'] - previous['value']) / previous['value']
+        worse = -change if current['better'] == 'higher' else change
+        mark = ' !' if worse > tolerance else ''
+        if mark:
+            regressions.append(name)
+        print('{:<24}{:>14}{:>14}{:>+9.1%}{}'.format(name, previous['value'],
+                                                     current['value'], change, mark))
+    return regressions
+
+
+def main():
+    args = parse_data()
+    results = run_benchmarks(args)
+    for name, record in sorted(results.items()):
+        print('{:<24}{:>12} {}'.format(name, record['value'], record['unit']))
+    report = {'version': __version__,
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'config': {'latency': args.latency, 'bandwidth': args.bandwidth,
+                         'faults': args.fault, 'size': args.size, 'files': args.files,
+                         'text_size': args.text_size,
+                         'small_size': args.small_size, 'repeat': args.repeat,
+                         'workers': args.workers},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)['results']
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,529 @@
+import os
+import sys
+import time
+import zlib
+import socket
+import hashlib
+import argparse
+import threading
+import socketserver
+
+FAULTS = ('refuse_pasv', 'drop_data', 'bad_login', 'no_pipelining', 'reject_pipelining',
+          'bad_hash', 'no_epsv', 'late_150')
+HASHES = {'SHA-256': 'sha256', 'MD5': 'md5', 'CRC32': 'crc32'}
+CHUNK_SIZE = 65536
+
+
+def deflated(chunks):
+    compressor = zlib.compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class StandInHandler(socketserver.BaseRequestHandler):
+    # one control session; replies leave no earlier than latency after
+    # the segment carrying their command arrived, like on a real link
+
+    def setup(self):
+        # replies are sent whole, Nagle would only hold them back
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.config = self.server.config
+        self.cwd = '/'
+        self.rest = 0
+        self.hash = 'SHA-256'
+        self.mode = 'S'
+        self.user = None
+        self.passive_sock = None
+        self.active_address = None
+        self.buffer = b''
+        # True for a command that came in behind another one, before its reply
+        self.queued = False
+        self.arrival = time.monotonic()
+
+    def handle(self):
+        self.reply('220 Stand-in FTP server ready')
+        while True:
+            line = self.read_line()
+            if line is None:
+                break
+            command, _, argument = line.partition(' ')
+            method = getattr(self, 'ftp_' + command.upper(), None)
+            if self.queued and 'reject_pipelining' in self.config['faults']:
+                # like servers that answer commands sent ahead of time with an error
+                self.reply('503 Wait for the reply before sending the next command')
+            elif method is None:
+                self.reply('502 Command not implemented')
+            elif method(argument) is False:
+                break
+        if self.passive_sock is not None:
+            self.passive_sock.close()
+
+    def read_line(self):
+        self.queued = b'\n' in self.buffer
+        while b'\n' not in self.buffer:
+            try:
+                data = self.request.recv(CHUNK_SIZE)
+            except OSError:
+                return None
+            if not data:
+                return None
+            self.arrival = time.monotonic()
+            self.buffer += data
+        line, _, self.buffer = self.buffer.partition(b'\n')
+        if 'no_pipelining' in self.config['faults']:
+            # like servers that flush their input after every command
+            self.buffer = b''
+        return line.decode('UTF-8', 'replace').rstrip('\r')
+
+    def reply(self, *lines):
+        delay = self.arrival + self.config['latency'] - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.request.sendall(''.join(line + '\r\n' for line in lines).encode('UTF-8'))
+
+    def path(self, argument):
+        path = os.path.normpath(os.path.join(self.cwd, argument or '.')).replace('\\', '/')
+        if not path.startswith('/'):
+            path = '/' + path.lstrip('/')
+        return path, os.path.join(self.config['root'], path.lstrip('/'))
+
+    def data_connection(self):
+        # None when there is no data connection to be had
+        try:
+            if self.passive_sock is not None:
+                self.passive_sock.settimeout(10)
+                try:
+                    connection, address = self.passive_sock.accept()
+                finally:
+                    self.passive_sock.close()
+                    self.passive_sock = None
+                return connection
+            if self.active_address is None:
+                return None
+            return socket.create_connection(self.active_address, 10)
+        except OSError:
+            return None
+
+    def send_data(self, connection, data_source):
+        # data_source yields chunks; bandwidth is enforced by pacing the sends
+        bandwidth = self.config['bandwidth']
+        limit = None
+        if 'drop_data' in self.config['faults']:
+            limit = self.config['drop_after']
+        if self.mode == 'Z':
+            data_source = deflated(data_source)
+        sent = 0
+        start_time = time.monotonic()
+        try:
+            for chunk in data_source:
+                if limit is not None and sent + len(chunk) > limit:
+                    connection.sendall(chunk[:max(limit - sent, 0)])
+                    sent = limit
+                    return False
+                connection.sendall(chunk)
+                sent += len(chunk)
+                if bandwidth:
+                    delay = start_time + sent / bandwidth - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            self.server.count('sent', sent)
+        return True
+
+    def receive_data(self, connection, file):
+        bandwidth = self.config['bandwidth']
+        decompressor = zlib.decompressobj() if self.mode == 'Z' else None
+        received = 0
+        start_time = time.monotonic()
+        try:
+            while True:
+                data = connection.recv(CHUNK_SIZE)
+                if not data:
+                    break
+                received += len(data)
+                file.write(data if decompressor is None else decompressor.decompress(data))
+                if bandwidth:
+                    delay = start_time + received / bandwidth - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+            if decompressor is not None:
+                file.write(decompressor.flush())
+        finally:
+            self.server.count('received', received)
+
+    def open_transfer(self):
+        # 150 and the data connection, None after a 425
+        late = 'late_150' in self.config['faults']
+        if not late:
+            self.reply('150 Opening data connection')
+        connection = self.data_connection()
+        if connection is None:
+            self.reply('425 Can\'t open data connection')
+            return None
+        if late:
+            # like vsftpd and proftpd, 150 only once the data connection is up
+            self.reply('150 Data connection established')
+        return connection
+
+    def transfer(self, data_source):
+        connection = self.open_transfer()
+        if connection is None:
+            return
+        try:
+            complete = self.send_data(connection, data_source)
+        except OSError:
+            complete = False
+        finally:
+            connection.close()
+        if complete:
+            self.reply('226 Transfer complete')
+        else:
+            self.reply('426 Connection closed; transfer aborted')
+
+    def ftp_USER(self, argument):
+        self.user = argument
+        self.reply('331 Password required for {}'.format(argument))
+
+    def ftp_PASS(self, argument):
+        expected = self.config['users'].get(self.user)
+        if 'bad_login' in self.config['faults'] or \
+                (self.config['users'] and expected != argument):
+            self.reply('530 Login incorrect')
+            return
+        self.reply('230 User logged in')
+
+    def ftp_SYST(self, argument):
+        self.reply('215 UNIX Type: L8')
+
+    def ftp_FEAT(self, argument):
+        self.reply('211-Features:', ' MDTM', ' SIZE', ' REST STREAM',
+                   ' MLST type*;size*;modify*;perm*;',
+                   ' HASH ' + ';'.join(name + ('*' if name == self.hash else '')
+                                       for name in HASHES),
+                   ' XCRC', ' XMD5', ' MODE Z', ' EPSV', ' EPRT', '211 End')
+
+    def ftp_HELP(self, argument):
+        commands = sorted(name[4:] for name in dir(self) if name.startswith('ftp_'))
+        self.reply('214-Commands:', ' ' + ' '.join(commands), '214 Help OK')
+
+    def ftp_NOOP(self, argument):
+        self.reply('200 NOOP ok')
+
+    def ftp_MODE(self, argument):
+        if argument.upper() not in ('S', 'Z'):
+            self.reply('504 Unsupported mode {}'.format(argument))
+            return
+        self.mode = argument.upper()
+        self.reply('200 Mode set to {}'.format(self.mode))
+
+    def ftp_TYPE(self, argument):
+        self.reply('200 Type set to {}'.format(argument))
+
+    def ftp_QUIT(self, argument):
+        self.reply('221 Goodbye')
+        return False
+
+    def ftp_PWD(self, argument):
+        self.reply('257 "{}" is current directory'.format(self.cwd))
+
+    def ftp_CWD(self, argument):
+        path, real_path = self.path(argument)
+        if not os.path.isdir(real_path):
+            self.reply('550 {}: No such directory'.format(argument))
+            return
+        self.cwd = path
+        self.reply('250 Directory changed to {}'.format(path))
+
+    def ftp_MKD(self, argument):
+        path, real_path = self.path(argument)
+        try:
+            os.mkdir(real_path)
+        except OSError:
+            self.reply('550 Cannot create {}'.format(argument))
+            return
+        self.reply('257 "{}" created'.format(path))
+
+    def ftp_DELE(self, argument):
+        path, real_path = self.path(argument)
+        try:
+            os.remove(real_path)
+        except OSError:
+            self.reply('550 Cannot delete {}'.format(argument))
+            return
+        self.reply('250 {} deleted'.format(path))
+
+    def ftp_SIZE(self, argument):
+        path, real_path = self.path(argument)
+        if not os.path.isfile(real_path):
+            self.reply('550 {}: No such file'.format(argument))
+            return
+        self.reply('213 {}'.format(os.path.getsize(real_path)))
+
+    def ftp_MDTM(self, argument):
+        path, real_path = self.path(argument)
+        if not os.path.isfile(real_path):
+            self.reply('550 {}: No such file'.format(argument))
+            return
+        self.reply('213 ' + time.strftime('%Y%m%d%H%M%S', time.gmtime(os.path.getmtime(real_path))))
+
+    def ftp_OPTS(self, argument):
+        option, _, value = argument.partition(' ')
+        if option.upper() != 'HASH':
+            self.reply('501 Unknown option {}'.format(option))
+        elif value.upper() not in HASHES:
+            self.reply('504 Unknown algorithm {}'.format(value))
+        else:
+            self.hash = value.upper()
+            self.reply('200 {}'.format(self.hash))
+
+    def digest(self, argument, algorithm):
+        path, real_path = self.path(argument)
+        if not os.path.isfile(real_path):
+            return None
+        crc, result = 0, None if algorithm == 'crc32' else hashlib.new(algorithm)
+        with open(real_path, 'rb') as file:
+            for data in iter(lambda: file.read(CHUNK_SIZE), b''):
+                if result is None:
+                    crc = zlib.crc32(data, crc)
+                else:
+                    result.update(data)
+        digest = '{:08x}'.format(crc) if result is None else result.hexdigest()
+        if 'bad_hash' in self.config['faults']:
+            digest = digest[::-1]
+        return digest
+
+    def ftp_HASH(self, argument):
+        digest = self.digest(argument, HASHES[self.hash])
+        if digest is None:
+            self.reply('550 {}: No such file'.format(argument))
+            return
+        size = os.path.getsize(self.path(argument)[1])
+        self.reply('213 {} 0-{} {} {}'.format(self.hash, size, digest, argument))
+
+    def ftp_XCRC(self, argument):
+        digest = self.digest(argument, 'crc32')
+        self.reply('550 {}: No such file'.format(argument) if digest is None else '250 ' + digest)
+
+    def ftp_XMD5(self, argument):
+        digest = self.digest(argument, 'md5')
+        self.reply('550 {}: No such file'.format(argument) if digest is None else '250 ' + digest)
+
+    def ftp_REST(self, argument):
+        self.rest = int(argument)
+        self.reply('350 Restarting at {}'.format(self.rest))
+
+    def listen(self):
+        if self.passive_sock is not None:
+            self.passive_sock.close()
+        self.passive_sock = socket.socket(self.request.family)
+        self.passive_sock.bind((self.request.getsockname()[0], 0))
+        self.passive_sock.listen(1)
+        return self.passive_sock.getsockname()[:2]
+
+    def ftp_PASV(self, argument):
+        if 'refuse_pasv' in self.config['faults']:
+            self.reply('502 Passive mode not available')
+            return
+        if self.request.family != socket.AF_INET:
+            self.reply('425 PASV is IPv4 only, use EPSV')
+            return
+        address, port = self.listen()
+        self.reply('227 Entering Passive Mode ({},{},{})'.format(
+            address.replace('.', ','), port // 256, port % 256))
+
+    def ftp_EPSV(self, argument):
+        if 'refuse_pasv' in self.config['faults'] or 'no_epsv' in self.config['faults']:
+            self.reply('502 Command not implemented')
+            return
+        address, port = self.listen()
+        self.reply('229 Entering Extended Passive Mode (|||{}|)'.format(port))
+
+    def ftp_PORT(self, argument):
+        numbs = argument.split(',')
+        if len(numbs) != 6:
+            self.reply('501 Bad PORT command')
+            return
+        if self.passive_sock is not None:
+            self.passive_sock.close()
+            self.passive_sock = None
+        self.active_address = ('.'.join(numbs[:4]), int(numbs[4]) * 256 + int(numbs[5]))
+        self.reply('200 PORT command successful')
+
+    def ftp_EPRT(self, argument):
+        # |protocol|address|port|, any character may stand for the bars
+        fields = argument[1:-1].split(argument[:1]) if argument else []
+        if 'no_epsv' in self.config['faults']:
+            self.reply('502 Command not implemented')
+            return
+        if len(fields) != 3 or fields[0] not in ('1', '2') or not fields[2].isdigit():
+            self.reply('501 Bad EPRT command')
+            return
+        if self.passive_sock is not None:
+            self.passive_sock.close()
+            self.passive_sock = None
+        self.active_address = (fields[1], int(fields[2]))
+        self.reply('200 EPRT command successful')
+
+    def ftp_RETR(self, argument):
+        path, real_path = self.path(argument)
+        offset, self.rest = self.rest, 0
+        if not os.path.isfile(real_path):
+            self.reply('550 {}: No such file'.format(argument))
+            return
+
+        def chunks():
+            with open(real_path, 'rb') as file:
+                file.seek(offset)
+                while True:
+                    data = file.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    yield data
+
+        self.transfer(chunks())
+
+    def store(self, argument, append):
+        path, real_path = self.path(argument)
+        offset, self.rest = self.rest, 0
+        if not os.path.isdir(os.path.dirname(real_path)):
+            self.reply('553 {}: No such directory'.format(argument))
+            return
+        connection = self.open_transfer()
+        if connection is None:
+            return
+        mode = 'ab' if append else ('r+b' if offset and os.path.exists(real_path) else 'wb')
+        try:
+            with open(real_path, mode) as file:
+                if mode == 'r+b':
+                    file.seek(offset)
+                    file.truncate()
+                self.receive_data(connection, file)
+        except OSError:
+            self.reply('426 Connection closed; transfer aborted')
+            return
+        finally:
+            connection.close()
+        self.reply('226 Transfer complete')
+
+    def ftp_ABOR(self, argument):
+        # transfers here run to the end before the next command is read; a data connection
+        # that was only being set up is dropped, whoever connected to it gets a reset
+        if self.passive_sock is not None:
+            self.passive_sock.close()
+            self.passive_sock = None
+        self.active_address = None
+        self.reply('225 No transfer to abort')
+
+    def ftp_STOR(self, argument):
+        self.store(argument, False)
+
+    def ftp_APPE(self, argument):
+        self.store(argument, True)
+
+    def listing(self, argument, line_format):
+        path, real_path = self.path(argument)
+        if not os.path.isdir(real_path):
+            self.reply('550 {}: No such directory'.format(argument))
+            return
+        lines = []
+        for name in sorted(os.listdir(real_path)):
+            stat = os.stat(os.path.join(real_path, name))
+            lines.append(line_format(name, stat))
+        self.transfer([''.join(lines).encode('UTF-8')])
+
+    def ftp_LIST(self, argument):
+        def unix_line(name, stat):
+            kind = 'd' if os.path.isdir(os.path.join(self.path(argument)[1], name)) else '-'
+            return '{}rw-r--r--   1 ftp      ftp  {:>12} {} {}\r\n'.format(
+                kind, stat.st_size, time.strftime('%b %d %Y', time.gmtime(stat.st_mtime)), name)
+
+        self.listing(argument, unix_line)
+
+    def ftp_MLSD(self, argument):
+        def facts_line(name, stat):
+            kind = 'dir' if os.path.isdir(os.path.join(self.path(argument)[1], name)) else 'file'
+            return 'type={};size={};modify={};perm={}; {}\r\n'.format(
+                kind, stat.st_size, time.strftime('%Y%m%d%H%M%S', time.gmtime(stat.st_mtime)),
+                'el' if kind == 'dir' else 'r', name)
+
+        self.listing(argument, facts_line)
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    # in-process FTP server over a local directory for benchmarks and experiments
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, root, host='127.0.0.1', port=0, latency=0.0, bandwidth=None,
+                 faults=(), users=None, drop_after=CHUNK_SIZE):
+        for fault in faults:
+            if fault not in FAULTS:
+                raise ValueError('Unknown fault {}, use one of: {}'.format(fault, ', '.join(FAULTS)))
+        # an instance attribute is enough, the socket is made in the constructor below
+        self.address_family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        super(StandInServer, self).__init__((host, port), StandInHandler)
+        self.config = {'root': os.path.abspath(root), 'latency': latency,
+                       'bandwidth': bandwidth, 'faults': set(faults),
+                       'users': users or {}, 'drop_after': drop_after}
+        self.thread = None
+        # data connection bytes as they went over the wire
+        self.wire = {'sent': 0, 'received': 0}
+        self.wire_lock = threading.Lock()
+
+    def count(self, direction, amount):
+        with self.wire_lock:
+            self.wire[direction] += amount
+
+    @property
+    def address(self):
+        return self.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def parse_data():
+    parser = argparse.ArgumentParser(prog='ftp_server.py',
+                                     description='''Stand-in FTP server over a local folder''')
+    parser.add_argument('root', help='Folder to serve')
+    parser.add_argument('port', help='Listening port', nargs='?', type=int, default=2121)
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Listening address, e.g. ::1 for IPv6')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Delay of every control reply in seconds')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='Data rate of every data connection in bytes per second')
+    parser.add_argument('--fault', action='append', default=[], choices=FAULTS,
+                        help='Misbehave in the given way')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_data()
+    server = StandInServer(args.root, args.host, args.port, latency=args.latency,
+                           bandwidth=args.bandwidth, faults=args.fault)
+    print('Serving {} on {}:{}'.format(args.root, *server.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,7 @@
+# the client as a library: FTPSession covers one control connection, the other
+# modules (mirror, sync, stream, batch, ...) are imported from the package when needed
+from .session import FTPSession
+from .exceptions import NotChangedDirectoryError, PipelineError, ChecksumError, TransferError
+
+__all__ = ['FTPSession', 'NotChangedDirectoryError', 'PipelineError', 'ChecksumError',
+           'TransferError']
@@ -0,0 +1,199 @@
+import os
+import re
+import asyncio
+from .reply import ReplyReader
+from .mirror import refusal
+from .network import PASV_REG, EPSV_REG
+
+TIMEOUT = 10
+CHUNK_SIZE = 65535
+SIZE_REG = re.compile(r'213 (\d+)')
+PWD_REG = re.compile(r'"(.*)"')
+
+
+class AsyncFTP:
+    # the same operations as FUNCTIONS in the CLI, as coroutines over asyncio streams;
+    # every network wait is bounded by timeout
+
+    def __init__(self, host, port=21, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.replies = ReplyReader(None)
+        # None until EPSV has been tried, False once the server turned it down
+        self.extended = None
+
+    async def connect(self):
+        self.reader, self.writer = await self.wait(asyncio.open_connection(self.host, self.port))
+        return await self.read_reply()
+
+    async def read_reply(self):
+        while not self.replies.pending():
+            line = await self.wait(self.reader.readline())
+            if not line:
+                raise ConnectionError('Connection closed by server')
+            self.replies.feed(line)
+        return self.replies.read_reply()
+
+    async def command(self, command, argument=None):
+        if argument is not None:
+            command = '{} {}'.format(command, argument)
+        self.writer.write(bytes('{}\r\n'.format(command), 'ASCII'))
+        await self.wait(self.writer.drain())
+        return await self.read_reply()
+
+    async def wait(self, operation):
+        return await asyncio.wait_for(operation, self.timeout)
+
+    async def login(self, name='anonymous', passw='example@mail.com'):
+        reply = await self.command('USER', name)
+        if reply.code == 331:
+            reply = await self.command('PASS', passw)
+        if reply.code // 100 != 2:
+            raise ValueError('Login is incorrect: {}'.format(reply))
+        return reply
+
+    async def cwd(self, path):
+        reply = await self.command('CWD', path)
+        if reply.code // 100 != 2:
+            raise NotADirectoryError('Cannot change directory to {}'.format(path))
+        return reply
+
+    async def pwd(self):
+        reply = await self.command('PWD')
+        result = PWD_REG.search(str(reply))
+        return result.group(1) if result else None
+
+    async def size(self, filename):
+        reply = await self.command('SIZE', filename)
+        result = SIZE_REG.match(str(reply))
+        if result is None:
+            raise FileNotFoundError('Cannot get size of {}'.format(filename))
+        return int(result.group(1))
+
+    async def pasv(self):
+        # EPSV first, it names no address; PASV for servers that do not know it
+        reply = None
+        if self.extended is not False:
+            reply = await self.command('EPSV')
+            numbs = EPSV_REG.search(str(reply)) if reply.code == 229 else None
+            if numbs is not None:
+                self.extended = True
+                address = self.writer.get_extra_info('peername')[0]
+                return await self.wait(asyncio.open_connection(address, int(numbs.group(2))))
+            if reply.code // 100 == 5 and ':' not in self.writer.get_extra_info('peername')[0]:
+                self.extended = False
+        if self.extended is False:
+            reply = await self.command('PASV')
+        numbs = PASV_REG.search(str(reply)) if reply.code == 227 else None
+        if numbs is None:
+            raise ConnectionError('Passive mode is not available: {}'.format(reply))
+        numbs = numbs.groups()
+        address = '.'.join(numbs[:4])
+        port = int(numbs[4]) * 256 + int(numbs[5])
+        return await self.wait(asyncio.open_connection(address, port))
+
+    async def type(self, kind):
+        reply = await self.command('TYPE', kind)
+        if reply.code // 100 != 2:
+            raise ConnectionError('TYPE {} failed: {}'.format(kind, reply))
+
+    async def transfer(self, command, argument):
+        data_reader, data_writer = await self.pasv()
+        query = command if argument is None else '{} {}'.format(command, argument)
+        reply = await self.command(query)
+        if reply.code not in (125, 150):
+            data_writer.close()
+            raise refusal(query, reply)
+        return data_reader, data_writer
+
+    async def finish(self, data_writer, query):
+        # as mirror.finish_transfer: only a 2xx after the data means it all arrived
+        data_writer.close()
+        reply = await self.read_reply()
+        if reply.code // 100 != 2:
+            raise ConnectionError('{} failed: {}'.format(query, reply))
+
+    async def list(self, path=None):
+        await self.type('A')
+        data_reader, data_writer = await self.transfer('LIST', path)
+        chunks = []
+        while True:
+            data = await self.wait(data_reader.read(CHUNK_SIZE))
+            if not data:
+                break
+            chunks.append(data)
+        await self.finish(data_writer, 'LIST {}'.format(path or ''))
+        return b''.join(chunks).decode('UTF-8', 'replace')
+
+    async def get(self, file_to_load, local_file=None):
+        # local files are opened, written and closed in the default executor,
+        # a slow disk must not hold up the other connections on the loop
+        if local_file is None:
+            local_file = os.path.basename(file_to_load)
+        loop = asyncio.get_event_loop()
+        await self.type('I')
+        data_reader, data_writer = await self.transfer('RETR', file_to_load)
+        try:
+            result = await loop.run_in_executor(None, open, local_file, 'wb')
+        except OSError:
+            # a local file that cannot be created leaves the session usable
+            data_writer.close()
+            await self.read_reply()
+            raise
+        received = 0
+        try:
+            while True:
+                data = await self.wait(data_reader.read(CHUNK_SIZE))
+                if not data:
+                    break
+                await loop.run_in_executor(None, result.write, data)
+                received += len(data)
+        finally:
+            await loop.run_in_executor(None, result.close)
+        await self.finish(data_writer, 'RETR {}'.format(file_to_load))
+        return received
+
+    async def put(self, local_file, remote_name=None):
+        # the local file is opened first, so a missing one costs no commands
+        if remote_name is None:
+            remote_name = os.path.basename(local_file)
+        loop = asyncio.get_event_loop()
+        file = await loop.run_in_executor(None, open, local_file, 'rb')
+        sent = 0
+        try:
+            await self.type('I')
+            data_reader, data_writer = await self.transfer('STOR', remote_name)
+            while True:
+                data = await loop.run_in_executor(None, file.read, CHUNK_SIZE)
+                if not data:
+                    break
+                data_writer.write(data)
+                await self.wait(data_writer.drain())
+                sent += len(data)
+        finally:
+            await loop.run_in_executor(None, file.close)
+        await self.finish(data_writer, 'STOR {}'.format(remote_name))
+        return sent
+
+    async def quit(self):
+        try:
+            await self.command('QUIT')
+        except (OSError, ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.writer.close()
+
+
+async def fan_out(operation, items, limit=100):
+    # runs operation(item) for every item, at most limit at a time;
+    # failures are returned in place of results
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(item):
+        async with semaphore:
+            return await operation(item)
+
+    return await asyncio.gather(*(bounded(item) for item in items), return_exceptions=True)
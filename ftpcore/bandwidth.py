@@ -0,0 +1,146 @@
+import re
+import time
+import itertools
+import threading
+
+ACTIVE_WINDOW = 1.0
+BURST = 0.25
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    # '500K', '2M', '1.5G' bytes per second; 'off' means unlimited
+    if text is None or text.lower() in ('off', 'none', '0'):
+        return None
+    result = re.match(r'^(\d+(?:\.\d+)?)([KMG]?)B?(?:/S)?$', text.upper())
+    if result is None:
+        raise ValueError('Cannot understand rate {}, use e.g. 500K or 2M'.format(text))
+    return float(result.group(1)) * UNITS[result.group(2)]
+
+
+class TokenBucket:
+    # tokens may go negative, the debt is paid off by waiting
+
+    def __init__(self, rate=None, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.tokens = min(self.tokens, self.capacity())
+
+    def capacity(self):
+        return self.rate * self.burst if self.rate else 0.0
+
+    def take(self, amount, now):
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.tokens + (now - self.stamp) * self.rate, self.capacity())
+        self.stamp = now
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Stream:
+    def __init__(self, scheduler, stream_id, host, rate, priority):
+        self.scheduler = scheduler
+        self.id = stream_id
+        self.host = host
+        self.bucket = TokenBucket(rate)
+        self.priority = priority
+        self.last_seen = self.clock = time.monotonic()
+        self.lock = threading.Lock()
+
+    def throttle(self, amount):
+        with self.lock:
+            delay = self.scheduler.reserve(self, amount)
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        self.scheduler.close(self)
+
+
+class Scheduler:
+    # global, per-host and per-transfer token buckets; the global and host rates are
+    # split between the transfers active right now in proportion to their priority
+
+    def __init__(self, rate=None, host_rate=None, transfer_rate=None):
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket(rate)
+        self.host_rate = host_rate
+        self.hosts = {}
+        self.transfer_rate = transfer_rate
+        self.streams = {}
+        self.ids = itertools.count(1)
+
+    def open(self, host, priority=1, rate=None):
+        with self.lock:
+            stream = Stream(self, next(self.ids), host, rate or self.transfer_rate, priority)
+            self.streams[stream.id] = stream
+            if host not in self.hosts:
+                self.hosts[host] = TokenBucket(self.host_rate)
+            return stream
+
+    def close(self, stream):
+        with self.lock:
+            self.streams.pop(stream.id, None)
+
+    def reserve(self, stream, amount):
+        now = time.monotonic()
+        with self.lock:
+            stream.last_seen = now
+            active = [other for other in self.streams.values()
+                      if now - other.last_seen < ACTIVE_WINDOW]
+            delays = [stream.bucket.take(amount, now),
+                      self.global_bucket.take(amount, now),
+                      self.hosts[stream.host].take(amount, now)]
+            share = self.share(stream, active)
+        if share:
+            # pacing clock of the transfer at its fair share of the shared limits
+            stream.clock = max(stream.clock, now) + amount / share
+            delays.append(stream.clock - now)
+        return max(delays)
+
+    def share(self, stream, active):
+        # idle transfers are not active, so their part goes to the others
+        shares = []
+        if self.global_bucket.rate:
+            total = sum(other.priority for other in active)
+            shares.append(self.global_bucket.rate * stream.priority / total)
+        host_rate = self.hosts[stream.host].rate
+        if host_rate:
+            total = sum(other.priority for other in active if other.host == stream.host)
+            shares.append(host_rate * stream.priority / total)
+        return min(shares) if shares else None
+
+    def set_limit(self, scope, rate):
+        # scope is 'global', 'host' (default for new hosts), 'transfer'
+        # (default for new transfers), a host name or a transfer id
+        with self.lock:
+            if scope == 'global':
+                self.global_bucket.set_rate(rate)
+            elif scope == 'host':
+                self.host_rate = rate
+                for bucket in self.hosts.values():
+                    bucket.set_rate(rate)
+            elif scope == 'transfer':
+                self.transfer_rate = rate
+            elif str(scope).isdigit() and int(scope) in self.streams:
+                self.streams[int(scope)].bucket.set_rate(rate)
+            else:
+                self.hosts.setdefault(scope, TokenBucket()).set_rate(rate)
+
+    def set_priority(self, stream_id, priority):
+        with self.lock:
+            self.streams[stream_id].priority = priority
+
+    def limits(self):
+        with self.lock:
+            return {'global': self.global_bucket.rate,
+                    'transfer': self.transfer_rate,
+                    'hosts': dict((host, bucket.rate) for host, bucket in self.hosts.items()),
+                    'active': dict((stream.id, (stream.host, stream.priority, stream.bucket.rate))
+                                   for stream in self.streams.values())}
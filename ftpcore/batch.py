@@ -0,0 +1,106 @@
+import os
+import csv
+import json
+import time
+import queue
+import threading
+from collections import namedtuple
+from .mirror import download, upload, throttled, WORKERS
+from .network import split_host
+
+Job = namedtuple('Job', 'host port user password direction remote local')
+DIRECTIONS = {'get': 'get', 'down': 'get', 'download': 'get',
+              'put': 'put', 'up': 'put', 'upload': 'put'}
+FIELDS = ('host', 'port', 'user', 'password', 'direction', 'remote', 'local')
+
+
+def load_manifest(filename, host=None, port=21, user='anonymous', password='example@mail.com'):
+    # JSON list of objects or CSV with a header row; host, port and login
+    # fall back to the ones given on the command line
+    with open(filename, 'r', newline='') as file:
+        if filename.lower().endswith('.json'):
+            records = json.load(file)
+        else:
+            records = list(csv.DictReader(row for row in file
+                                          if row.strip() and not row.startswith('#')))
+    jobs = []
+    for number, record in enumerate(records, 1):
+        record = dict((key.strip().lower(), str(value).strip())
+                      for key, value in record.items() if key and value not in (None, ''))
+        unknown = set(record) - set(FIELDS)
+        if unknown:
+            raise ValueError('Job {}: unknown fields {}'.format(number, ', '.join(sorted(unknown))))
+        job_host, job_port = split_host(record.get('host', host or ''))
+        direction = DIRECTIONS.get(record.get('direction', '').lower())
+        if not job_host or direction is None or \
+                ('remote' not in record and 'local' not in record):
+            raise ValueError('Job {}: host, direction (get|put) and a path are required'
+                             .format(number))
+        remote = record.get('remote') or os.path.basename(record['local'])
+        local = record.get('local') or os.path.basename(remote)
+        jobs.append(Job(job_host, int(record.get('port', job_port or port)),
+                        record.get('user', user), record.get('password', password),
+                        direction, remote, local))
+    return jobs
+
+
+def run_jobs(pool, jobs, workers=WORKERS, scheduler=None, report=None, passive=True):
+    # sessions come from the pool, so a host is logged in at most once per worker
+    tasks = queue.Queue()
+    results = []
+    lock = threading.Lock()
+    for job in jobs:
+        tasks.put(job)
+
+    def execute(job):
+        start_time = time.time()
+        try:
+            with pool.session(job.host, job.port, job.user, job.password) as sock:
+                if job.direction == 'get':
+                    directory = os.path.dirname(job.local)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    count = throttled(scheduler, job.host, download, sock, job.remote, job.local,
+                                      passive=passive)
+                else:
+                    count = throttled(scheduler, job.host, upload, sock, job.local, job.remote,
+                                      passive=passive)
+            error = None
+        except Exception as exception:
+            count, error = 0, exception
+        return job, error, count, time.time() - start_time
+
+    def worker():
+        while True:
+            try:
+                job = tasks.get_nowait()
+            except queue.Empty:
+                return
+            result = execute(job)
+            with lock:
+                results.append(result)
+            if report is not None:
+                report(*result)
+
+    threads = [threading.Thread(target=worker) for i in range(max(min(workers, len(jobs)), 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def route(job):
+    # the two ends of a job in the order the data goes
+    return (job.remote, job.local) if job.direction == 'get' else (job.local, job.remote)
+
+
+def summary(results, seconds):
+    failed = [result for result in results if result[1] is not None]
+    lines = ['{} jobs in {:.1f} s: {} done, {} failed, {} bytes'.format(
+        len(results), seconds, len(results) - len(failed), len(failed),
+        sum(result[2] for result in results))]
+    for job, error, count, elapsed in failed:
+        lines.append('  {} {}:{} {} -> {}: {}'.format(job.direction, job.host, job.port,
+                                                     *route(job), str(error).strip()))
+    return '\n'.join(lines), not failed
@@ -0,0 +1,51 @@
+import re
+import zlib
+import hashlib
+
+ALGORITHMS = ('crc32', 'md5', 'sha256')
+LENGTHS = {'crc32': 8, 'md5': 32, 'sha256': 64}
+# names used by the HASH command and FEAT, and the older one-algorithm commands
+HASH_NAMES = {'crc32': 'CRC32', 'md5': 'MD5', 'sha256': 'SHA-256'}
+X_COMMANDS = {'crc32': 'XCRC', 'md5': 'XMD5', 'sha256': 'XSHA256'}
+
+
+class Digest:
+    # fed with the same buffers that go to the disk or the socket, so no extra pass is needed
+
+    def __init__(self, algorithm):
+        if algorithm not in ALGORITHMS:
+            raise ValueError('Unknown checksum {}, use one of: {}'
+                             .format(algorithm, ', '.join(ALGORITHMS)))
+        self.algorithm = algorithm
+        self.hash = None if algorithm == 'crc32' else hashlib.new(algorithm)
+        self.crc = 0
+
+    def update(self, data):
+        if self.hash is None:
+            self.crc = zlib.crc32(data, self.crc)
+        else:
+            self.hash.update(data)
+
+    def hexdigest(self):
+        if self.hash is None:
+            return '{:08x}'.format(self.crc)
+        return self.hash.hexdigest()
+
+
+def parse_checksum(text, algorithm):
+    # first hex word of the right length in a reply or a sidecar file
+    result = re.search(r'\b([0-9a-fA-F]{%d})\b' % LENGTHS[algorithm], text)
+    return result.group(1).lower() if result else None
+
+
+def parse_hash(text, algorithm):
+    # a HASH reply is 'algorithm range digest name'; taken by position, because a
+    # range such as 0-12000000 looks just like a crc32
+    words = text.split(None, 3)
+    if len(words) < 3 or words[0].upper() != HASH_NAMES[algorithm]:
+        return None
+    return parse_checksum(words[2], algorithm)
+
+
+def sidecar_name(path, algorithm):
+    return '{}.{}'.format(path, algorithm)
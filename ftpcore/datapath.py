@@ -0,0 +1,163 @@
+import mmap
+import zlib
+from .tuning import ChunkSizer
+
+CHUNK_SIZE = 65535
+SENDFILE_BLOCK = 4 * 1024 * 1024
+LEVEL = 6
+# MODE Z output held in memory at once, whatever the compression ratio
+INFLATE_LIMIT = 16 * CHUNK_SIZE
+
+
+def receive_to_file(data_sock, file, size=None, progress=None, zero_copy=True, throttle=None,
+                    digest=None, sizer=None):
+    # reads until size bytes (or EOF if size is None) are written to file,
+    # sizer picks how much every recv asks for
+    sizer = sizer or ChunkSizer()
+    received = 0
+    buffer = None
+    while size is None or size > received:
+        wanted = sizer.size if size is None else min(sizer.size, size - received)
+        if zero_copy:
+            if buffer is None or len(buffer) < sizer.size:
+                buffer = memoryview(bytearray(sizer.size))
+            count = data_sock.recv_into(buffer, wanted)
+            if not count:
+                break
+            file.write(buffer[:count])
+            if digest is not None:
+                digest.update(buffer[:count])
+        else:
+            data = data_sock.recv(wanted)
+            if not data:
+                break
+            file.write(data)
+            if digest is not None:
+                digest.update(data)
+            count = len(data)
+        sizer.record(count, wanted)
+        received += count
+        if throttle is not None:
+            throttle(count)
+        if progress is not None:
+            progress(received)
+    return received
+
+
+def receive_to_mmap(data_sock, file, offset, length, progress=None, throttle=None, sizer=None):
+    # the file is already preallocated, so bytes go from the socket straight into the page cache
+    sizer = sizer or ChunkSizer()
+    received = 0
+    mapping = mmap.mmap(file.fileno(), 0)
+    view = memoryview(mapping)
+    try:
+        while length > received:
+            start = offset + received
+            wanted = min(sizer.size, length - received)
+            count = data_sock.recv_into(view[start:start + wanted])
+            if not count:
+                break
+            sizer.record(count, wanted)
+            received += count
+            if throttle is not None:
+                throttle(count)
+            if progress is not None:
+                progress(received)
+    finally:
+        view.release()
+        mapping.close()
+    return received
+
+
+def send_from_file(data_sock, file, offset, count, progress=None, zero_copy=True, throttle=None,
+                   digest=None, sizer=None):
+    # sends count bytes of file starting at offset, with kernel sendfile when zero_copy is on;
+    # sendfile keeps the bytes away from us, so a digest needs the copying loop
+    zero_copy = zero_copy and digest is None
+    sizer = sizer or ChunkSizer()
+    sent = 0
+    file.seek(offset)
+    while count > sent:
+        # a throttled transfer has to come back for tokens often enough
+        wanted = min(SENDFILE_BLOCK if zero_copy and throttle is None else sizer.size,
+                     count - sent)
+        if zero_copy:
+            portion = data_sock.sendfile(file, offset + sent, wanted)
+        else:
+            data = file.read(wanted)
+            data_sock.sendall(data)
+            if digest is not None:
+                digest.update(data)
+            portion = len(data)
+        if not portion:
+            break
+        sizer.record(portion, wanted)
+        sent += portion
+        if throttle is not None:
+            throttle(portion)
+        if progress is not None:
+            progress(sent)
+    return sent
+
+
+def receive_inflated(data_sock, file, progress=None, throttle=None, digest=None, sizer=None):
+    # MODE Z: the data connection carries one zlib stream, read until EOF;
+    # returns bytes written and bytes that came over the wire
+    sizer = sizer or ChunkSizer()
+    decompressor = zlib.decompressobj()
+    written = wire = 0
+    while True:
+        wanted = sizer.size
+        data = data_sock.recv(wanted)
+        if not data:
+            break
+        sizer.record(len(data), wanted)
+        wire += len(data)
+        if throttle is not None:
+            throttle(len(data))
+        while data:
+            plain = decompressor.decompress(data, INFLATE_LIMIT)
+            data = decompressor.unconsumed_tail
+            file.write(plain)
+            if digest is not None:
+                digest.update(plain)
+            written += len(plain)
+        if progress is not None:
+            progress(written)
+    plain = decompressor.flush()
+    file.write(plain)
+    if digest is not None:
+        digest.update(plain)
+    written += len(plain)
+    if not decompressor.eof:
+        raise ConnectionError('Compressed data ended too early')
+    return written, wire
+
+
+def send_deflated(data_sock, file, offset, count, progress=None, throttle=None, digest=None,
+                  sizer=None, level=LEVEL):
+    # MODE Z counterpart of send_from_file; returns bytes read and bytes sent over the wire
+    sizer = sizer or ChunkSizer()
+    compressor = zlib.compressobj(level)
+    sent = wire = 0
+    file.seek(offset)
+    while count > sent:
+        wanted = min(sizer.size, count - sent)
+        data = file.read(wanted)
+        if not data:
+            break
+        sizer.record(len(data), wanted)
+        if digest is not None:
+            digest.update(data)
+        packed = compressor.compress(data)
+        if packed:
+            data_sock.sendall(packed)
+            wire += len(packed)
+            if throttle is not None:
+                throttle(len(packed))
+        sent += len(data)
+        if progress is not None:
+            progress(sent)
+    packed = compressor.flush()
+    data_sock.sendall(packed)
+    return sent, wire + len(packed)
@@ -0,0 +1,33 @@
+
+
+class NotChangedDirectoryError(Exception):
+    def __init__(self, message):
+
+        # Call the base class constructor with the parameters it needs
+        super(NotChangedDirectoryError, self).__init__(message)
+
+
+
+class PipelineError(Exception):
+    def __init__(self, message, replies):
+
+        # Replies that had arrived before the server stopped answering
+        super(PipelineError, self).__init__(message)
+        self.replies = replies
+
+
+class ChecksumError(Exception):
+    def __init__(self, message, expected, actual):
+
+        # Digest announced for the file and digest of the bytes that went over the wire
+        super(ChecksumError, self).__init__(message)
+        self.expected = expected
+        self.actual = actual
+
+
+class TransferError(Exception):
+    def __init__(self, message, reply):
+
+        # The control connection is still fine, only this transfer failed
+        super(TransferError, self).__init__(message)
+        self.reply = reply
@@ -0,0 +1,120 @@
+import socket
+import posixpath
+from .session import NUMBER_REG
+from .exceptions import ChecksumError
+from .network import passive_command, refused_epsv, passive_address
+
+
+def listen(session):
+    # the server opens a data port and waits; returns the address it gave
+    session.compressed(False)
+    query = passive_command(session.sock)
+    replies = session.transaction('TYPE I', query)
+    if query == 'EPSV' and refused_epsv(session.sock, replies[-1]):
+        replies[-1] = session.command('PASV')
+    return passive_address(session.sock, replies[-1])
+
+
+def point(session, address):
+    # the server will connect to the other one instead of to us
+    session.compressed(False)
+    host, port = address
+    if ':' in host:
+        query = 'EPRT |2|{}|{}|'.format(host, port)
+    else:
+        query = 'PORT {},{},{}'.format(host.replace('.', ','), port // 256, port % 256)
+    reply = session.transaction('TYPE I', query)[-1]
+    if not reply.startswith('2'):
+        raise ConnectionError('{} refused to connect to the other server: {}'
+                              .format(session.host, reply.strip()))
+
+
+def abort(session):
+    # takes back a STOR or RETR that is waiting for a data connection which will never come,
+    # or has finished already; how many replies it still gets (a late 150, then 426 or 226)
+    # depends on how far it went, so a NOOP behind ABOR marks where they end
+    try:
+        if session.state.pipelining is False:
+            reply = session.command('ABOR')
+            if reply.startswith('4'):
+                # the reply to the aborted command goes first, then the one to ABOR
+                session.receive()
+            return
+        session.send('ABOR')
+        session.send('NOOP')
+        while not session.receive().startswith('200'):
+            pass
+    except OSError:
+        session.close()
+
+
+def copy(source, target, source_path, target_path=None, wait=None):
+    # FXP: the target listens (PASV), the source connects to it (PORT) and the bytes go
+    # straight from one server to the other; this client only reads the final replies.
+    # wait is how long they may take, None for as long as the file needs
+    if target_path is None:
+        target_path = posixpath.basename(source_path)
+    # a missing file is found out before the target has been asked for anything
+    reply = source.command('SIZE', source_path)
+    if reply.startswith('550'):
+        raise FileNotFoundError('{}: {}'.format(source_path, reply.strip()))
+    match = NUMBER_REG.match(reply)
+    size = int(match.group(1)) if match else None
+    # the passive side gets its command first, so it is listening when the other connects
+    sides = [(target, 'STOR', target_path), (source, 'RETR', source_path)]
+    try:
+        address = listen(target)
+    except ConnectionError:
+        # the target cannot listen, the source may
+        sides.reverse()
+        address = listen(source)
+    point(sides[1][0], address)
+    if target.cache is not None:
+        target.cache.invalidate_parent(target.remote_path(target_path))
+    # both commands go out before either reply is read: vsftpd and proftpd answer 150
+    # on the listening side only once the other side has connected to it
+    for session, command, path in sides:
+        session.send(command, path)
+    replies = []
+    try:
+        for session, command, path in sides:
+            replies.append(session.receive())
+    except socket.timeout:
+        for session, command, path in sides:
+            abort(session)
+        raise ConnectionError('Server-to-server copy of {} did not start: {}'
+                              .format(source_path, ' / '.join(reply.strip() for reply in replies)
+                                      or 'no reply'))
+    for (session, command, path), reply in zip(sides, replies):
+        if reply.startswith('150') or reply.startswith('125'):
+            continue
+        # both sides are taken back, the one that refused first: ABOR drops the data port
+        # it may still listen on, which stops what the other side has started sending
+        for other, answer in sorted(zip(sides, replies), key=lambda item: item[1][:1] == '1'):
+            abort(other[0])
+        if not reply.startswith('5'):
+            raise ConnectionError('{} {} failed: {}'.format(command, path, reply.strip()))
+        error = FileNotFoundError if command == 'RETR' else PermissionError
+        raise error('{} {} failed: {}'.format(command, path, reply.strip()))
+    replies = []
+    for session, command, path in sides:
+        timeout = session.sock.gettimeout()
+        session.sock.settimeout(wait)
+        try:
+            replies.append(session.receive())
+        finally:
+            session.sock.settimeout(timeout)
+    failed = [reply.strip() for reply in replies if not reply.startswith('2')]
+    if failed:
+        raise ConnectionError('Server-to-server copy failed: ' + ' / '.join(failed))
+    copied = target.size(target_path, False)
+    if size is not None and copied is not None and copied != size:
+        raise ConnectionError('{} has {} of {} bytes'.format(target_path, copied, size))
+    if source.verify:
+        expected = source.server_checksum(source_path)
+        actual = target.server_checksum(target_path, source.verify)
+        if expected is not None and actual is not None and expected != actual:
+            raise ChecksumError('{} checksum of {} does not match: expected {}, got {}'
+                                .format(source.verify, target_path, expected, actual),
+                                expected, actual)
+    return copied if copied is not None else size
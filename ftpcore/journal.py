@@ -0,0 +1,40 @@
+import os
+import json
+
+JOURNAL_SUFFIX = '.ftpjournal'
+
+
+def journal_path(local_file):
+    return local_file + JOURNAL_SUFFIX
+
+
+def load_journal(local_file):
+    try:
+        with open(journal_path(local_file), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_journal(local_file, **record):
+    with open(journal_path(local_file), 'w') as file:
+        json.dump(record, file)
+
+
+def remove_journal(local_file):
+    try:
+        os.remove(journal_path(local_file))
+    except OSError:
+        pass
+
+
+def local_state(local_file):
+    stat = os.stat(local_file)
+    return {'local_size': stat.st_size, 'local_mtime': int(stat.st_mtime)}
+
+
+def matches(journal, **record):
+    # a partial file is only trusted if everything recorded next to it is unchanged
+    if journal is None:
+        return False
+    return all(journal.get(key) == value for key, value in record.items())
@@ -0,0 +1,288 @@
+import re
+import sys
+import time
+import math
+import fnmatch
+import calendar
+import posixpath
+import threading
+from array import array
+from functools import lru_cache
+from collections import namedtuple, OrderedDict
+
+TTL = 60
+MAX_DIRS = 1024
+ENCODING = 'UTF-8'
+
+Entry = namedtuple('Entry', ['name', 'type', 'size', 'modify', 'perms'])
+
+UNIX_REG = re.compile(r'^([\-dlcbps])(\S{9})\S*\s+\d+\s+\S+\s+(?:\S+\s+)?(\d+)\s+'
+                      r'(\w{3}\s+\d{1,2}\s+(?:\d{4}|\d{1,2}:\d{2}))\s(.+)$')
+DOS_REG = re.compile(r'^(\d{2}-\d{2}-\d{2,4}\s+\d{1,2}:\d{2}[AP]M)\s+(<DIR>|\d+)\s+(.+)$')
+TYPES = {'-': 'file', 'd': 'dir', 'l': 'link'}
+KINDS = ('file', 'dir', 'link', 'other')
+KIND_CODES = dict((kind, code) for code, kind in enumerate(KINDS))
+MONTHS = dict((name, number) for number, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1))
+SORT_KEYS = ('name', 'size', 'time', 'type')
+
+
+class Listing:
+    # a directory as parallel columns instead of an object per entry, so a listing of
+    # hundreds of thousands of files stays small; iterating still gives Entry tuples,
+    # filter() and sort() work on the columns and return a new Listing
+
+    __slots__ = ('names', 'kinds', 'sizes', 'mtimes', 'modifies', 'perms', 'index')
+
+    def __init__(self):
+        self.names = []
+        # index into KINDS
+        self.kinds = bytearray()
+        # -1 when the size is unknown
+        self.sizes = array('q')
+        # seconds since the epoch, NaN when the date is unknown
+        self.mtimes = array('d')
+        # the date as the server wrote it; equal dates and permissions share one string
+        self.modifies = []
+        self.perms = []
+        self.index = None
+
+    def add(self, name, kind, size, modify, perms):
+        if modify is not None:
+            modify = sys.intern(modify)
+        self.names.append(name)
+        self.kinds.append(KIND_CODES.get(kind, KIND_CODES['other']))
+        self.sizes.append(-1 if size is None else size)
+        self.mtimes.append(parse_time(modify) if modify is not None else math.nan)
+        self.modifies.append(modify)
+        self.perms.append(sys.intern(perms) if perms is not None else None)
+        self.index = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, number):
+        size = self.sizes[number]
+        return Entry(self.names[number], KINDS[self.kinds[number]], size if size >= 0 else None,
+                     self.modifies[number], self.perms[number])
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.names)))
+
+    def find(self, name):
+        if self.index is None:
+            self.index = dict((entry_name, number) for number, entry_name in enumerate(self.names))
+        number = self.index.get(name)
+        return self[number] if number is not None else None
+
+    def take(self, numbers):
+        result = Listing()
+        result.names = [self.names[number] for number in numbers]
+        result.kinds = bytearray(self.kinds[number] for number in numbers)
+        result.sizes = array('q', (self.sizes[number] for number in numbers))
+        result.mtimes = array('d', (self.mtimes[number] for number in numbers))
+        result.modifies = [self.modifies[number] for number in numbers]
+        result.perms = [self.perms[number] for number in numbers]
+        return result
+
+    def filter(self, kind=None, pattern=None, min_size=None, max_size=None, newer=None,
+               older=None):
+        # entries with an unknown size or date never pass a size or date condition
+        numbers = range(len(self.names))
+        if kind is not None:
+            code, kinds = KIND_CODES[kind], self.kinds
+            numbers = [number for number in numbers if kinds[number] == code]
+        if pattern is not None:
+            match, names = re.compile(fnmatch.translate(pattern)).match, self.names
+            numbers = [number for number in numbers if match(names[number])]
+        sizes, mtimes = self.sizes, self.mtimes
+        if min_size is not None:
+            numbers = [number for number in numbers if sizes[number] >= min_size]
+        if max_size is not None:
+            numbers = [number for number in numbers if 0 <= sizes[number] <= max_size]
+        if newer is not None:
+            numbers = [number for number in numbers if mtimes[number] >= newer]
+        if older is not None:
+            numbers = [number for number in numbers if mtimes[number] < older]
+        return self.take(numbers)
+
+    def sort(self, key='name', reverse=False):
+        # unknown sizes and dates come first
+        if key == 'time':
+            column = [-math.inf if math.isnan(mtime) else mtime for mtime in self.mtimes]
+        else:
+            column = {'name': self.names, 'size': self.sizes, 'type': self.kinds}[key]
+        return self.take(sorted(range(len(self.names)), key=column.__getitem__, reverse=reverse))
+
+    def total_size(self):
+        return sum(size for size in self.sizes if size > 0)
+
+
+class ListParser:
+    # a file-like sink for the data connection: whole lines are parsed as they arrive,
+    # a line cut between two recv() calls waits for its end
+
+    def __init__(self, mlsd=False):
+        self.listing = Listing()
+        self.parse = add_mlsd_line if mlsd else add_list_line
+        self.rest = b''
+
+    def write(self, data):
+        data = bytes(data)
+        end = data.rfind(b'\n')
+        if end < 0:
+            self.rest += data
+            return len(data)
+        text = (self.rest + data[:end]).decode(ENCODING, 'replace')
+        self.rest = data[end + 1:]
+        for line in text.split('\n'):
+            self.parse(self.listing, line.rstrip('\r'))
+        return len(data)
+
+    def close(self):
+        if self.rest:
+            self.parse(self.listing, self.rest.decode(ENCODING, 'replace').rstrip('\r'))
+            self.rest = b''
+        return self.listing
+
+
+@lru_cache(maxsize=4096)
+def parse_time(text):
+    # MLSD 'YYYYMMDDHHMMSS', ls 'Jun 20  2013' or 'Jun 20 13:45', DOS '06-20-13 01:45PM';
+    # all taken as UTC, NaN when the text is none of them
+    try:
+        if text[:14].isdigit() and len(text) >= 14:
+            return float(calendar.timegm((int(text[:4]), int(text[4:6]), int(text[6:8]),
+                                          int(text[8:10]), int(text[10:12]), int(text[12:14]))))
+        words = text.split()
+        month = MONTHS.get(words[0].lower()) if len(words) == 3 else None
+        if month is not None:
+            day = int(words[1])
+            if ':' not in words[2]:
+                return float(calendar.timegm((int(words[2]), month, day, 0, 0, 0)))
+            # a recent file shows the time without the year, and it is never in the future
+            hour, minute = (int(number) for number in words[2].split(':'))
+            year = time.gmtime().tm_year
+            stamp = calendar.timegm((year, month, day, hour, minute, 0))
+            if stamp > time.time() + 86400:
+                stamp = calendar.timegm((year - 1, month, day, hour, minute, 0))
+            return float(stamp)
+        if len(words) == 2 and words[1][-2:].upper() in ('AM', 'PM'):
+            month, day, year = (int(number) for number in words[0].split('-'))
+            if year < 100:
+                year += 2000 if year < 70 else 1900
+            hour, minute = (int(number) for number in words[1][:-2].split(':'))
+            hour = hour % 12 + (12 if words[1][-2:].upper() == 'PM' else 0)
+            return float(calendar.timegm((year, month, day, hour, minute, 0)))
+    except (ValueError, IndexError, OverflowError):
+        pass
+    return math.nan
+
+
+def parse_list_line(line):
+    result = UNIX_REG.match(line)
+    if result is not None:
+        kind, perms, size, modify, name = result.groups()
+        kind = TYPES.get(kind, 'other')
+        if kind == 'link':
+            name = name.split(' -> ')[0]
+        return Entry(name, kind, int(size), modify, perms)
+    result = DOS_REG.match(line)
+    if result is not None:
+        modify, size, name = result.groups()
+        if size == '<DIR>':
+            return Entry(name, 'dir', 0, modify, None)
+        return Entry(name, 'file', int(size), modify, None)
+    return None
+
+
+def add_list_line(listing, line):
+    entry = parse_list_line(line)
+    if entry is not None and entry.name not in ('.', '..'):
+        listing.add(*entry)
+
+
+def parse_list(text):
+    listing = Listing()
+    for line in text.splitlines():
+        add_list_line(listing, line)
+    return listing
+
+
+def parse_mlsd_line(line):
+    facts, _, name = line.partition(' ')
+    if not name:
+        return None
+    values = {}
+    for fact in facts.split(';'):
+        key, _, value = fact.partition('=')
+        if key:
+            values[key.lower()] = value
+    kind = values.get('type', 'file').lower()
+    if kind.startswith('os.unix=slink'):
+        kind = 'link'
+    size = values.get('size', values.get('sizd'))
+    return Entry(name, kind, int(size) if size is not None else None,
+                 values.get('modify'), values.get('perm'))
+
+
+def add_mlsd_line(listing, line):
+    entry = parse_mlsd_line(line)
+    if entry is not None and entry.type not in ('cdir', 'pdir'):
+        listing.add(*entry)
+
+
+def parse_mlsd(text):
+    listing = Listing()
+    for line in text.splitlines():
+        add_mlsd_line(listing, line)
+    return listing
+
+
+class DirCache:
+    # listings by absolute path, the least recently used one goes first when full
+
+    def __init__(self, ttl=TTL, max_dirs=MAX_DIRS):
+        self.ttl = ttl
+        self.max_dirs = max_dirs
+        self.dirs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        path = normalize(path)
+        with self.lock:
+            cached = self.dirs.get(path)
+            if cached is None:
+                return None
+            if time.time() - cached[0] > self.ttl:
+                del self.dirs[path]
+                return None
+            self.dirs.move_to_end(path)
+            return cached[1]
+
+    def put(self, path, entries):
+        with self.lock:
+            self.dirs[normalize(path)] = (time.time(), entries)
+            self.dirs.move_to_end(normalize(path))
+            while len(self.dirs) > self.max_dirs:
+                self.dirs.popitem(last=False)
+
+    def lookup(self, path):
+        parent, name = posixpath.split(normalize(path))
+        entries = self.get(parent)
+        return entries.find(name) if entries is not None else None
+
+    def invalidate(self, path):
+        with self.lock:
+            self.dirs.pop(normalize(path), None)
+
+    def invalidate_parent(self, path):
+        self.invalidate(posixpath.dirname(normalize(path)))
+
+    def clear(self):
+        with self.lock:
+            self.dirs.clear()
+
+
+def normalize(path):
+    return posixpath.normpath('/' + path.lstrip('/')) if path else '/'
@@ -0,0 +1,171 @@
+import math
+import time
+import weakref
+import threading
+from collections import deque, Counter
+
+BASE = 2 ** 0.25
+# scale and unit of a histogram by the last part of its name, seconds otherwise
+UNITS = {'throughput': (2 ** -20, 'MB/s'), 'chunk': (2 ** -10, 'KB')}
+
+
+class Histogram:
+    # log-scale buckets, each about 19% wide, so memory does not grow with samples
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.buckets[math.floor(math.log(value, BASE)) if value > 0 else None] += 1
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self.buckets, key=lambda key: -math.inf if key is None else key):
+            seen += self.buckets[index]
+            if seen >= rank:
+                value = 0.0 if index is None else BASE ** (index + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'mean': self.total / self.count, 'min': self.min,
+                'p50': self.percentile(0.5), 'p90': self.percentile(0.9),
+                'p99': self.percentile(0.99), 'max': self.max}
+
+
+class DataPhase:
+    # wraps a progress callback: the first call gives time to first byte,
+    # finish gives the sustained rate from the first byte on
+
+    def __init__(self, metrics, kind, started, progress=None):
+        self.metrics = metrics
+        self.kind = kind
+        self.started = started
+        self.progress = progress
+        self.first = None
+        self.done = 0
+
+    def __call__(self, done):
+        if self.first is None:
+            self.first = time.monotonic()
+            self.metrics.observe(self.kind + '.ttfb', self.first - self.started)
+        self.done = done
+        if self.progress is not None:
+            self.progress(done)
+
+    def finish(self):
+        if self.first is None:
+            return
+        elapsed = time.monotonic() - self.first
+        if elapsed > 0 and self.done:
+            self.metrics.observe(self.kind + '.throughput', self.done / elapsed)
+        self.metrics.add('bytes.' + self.kind, self.done)
+
+
+class SessionMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self.pending = weakref.WeakKeyDictionary()
+        self.started = time.time()
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(value)
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def command_sent(self, sock, command):
+        verb = command.split(' ')[0].upper()
+        with self.lock:
+            self.pending.setdefault(sock, deque()).append([verb, time.monotonic(), False])
+
+    def reply_received(self, sock, reply):
+        # a 1xx reply answers the command, the command stays pending until its final reply
+        now = time.monotonic()
+        code = str(reply)[:3]
+        with self.lock:
+            self.counters['reply.' + code] += 1
+            queue = self.pending.get(sock)
+            if not queue:
+                return
+            entry = queue[0]
+            if not code.startswith('1'):
+                queue.popleft()
+        if not entry[2]:
+            entry[2] = True
+            self.observe('rtt.' + entry[0], now - entry[1])
+
+    def forget(self, sock):
+        # drops commands that will never be answered, e.g. after a failed pipeline
+        with self.lock:
+            self.pending.pop(sock, None)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+    def data_phase(self, kind, started, progress=None):
+        return DataPhase(self, kind, started, progress)
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def snapshot(self):
+        with self.lock:
+            return {'started': self.started, 'uptime': time.time() - self.started,
+                    'counters': dict(self.counters),
+                    'histograms': dict((name, histogram.summary())
+                                       for name, histogram in sorted(self.histograms.items()))}
+
+    def export(self, filename):
+        import json
+        with open(filename, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2, sort_keys=True)
+
+    def report(self):
+        snapshot = self.snapshot()
+        lines = ['{:<24}{:>7}{:>11}{:>11}{:>11}{:>11}'.format(
+            'metric', 'count', 'mean', 'p50', 'p90', 'max')]
+        for name, summary in snapshot['histograms'].items():
+            scale, unit = UNITS.get(name.rsplit('.', 1)[-1], (1000, 'ms'))
+            lines.append('{:<24}{:>7}'.format(name, summary['count']) +
+                         ''.join('{:>11.2f}'.format(summary[key] * scale)
+                                 for key in ('mean', 'p50', 'p90', 'max')) + ' ' + unit)
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append('{:<24}{:>18}'.format(name, value))
+        return '\n'.join(lines)
+
+
+class Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.metrics.observe(self.name, time.monotonic() - self.start)
@@ -0,0 +1,424 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from .reply import read_reply, reader_for, state_of, transaction
+from .listing import ListParser
+from .datapath import receive_to_file, send_from_file, receive_inflated, send_deflated
+from .tuning import connect_data
+from .network import passive_command, refused_epsv, passive_address, port_listener
+
+WORKERS = 4
+# files up to this size go in batches of BATCH through pipelined transfers,
+# with the data commands of up to WINDOW files waiting at the server
+SMALL_FILE = 256 * 1024
+BATCH = 64
+WINDOW = 8
+
+
+def command(sock, query):
+    sock.sendall(bytes('{}\r\n'.format(query), 'ASCII'))
+    return read_reply(sock)
+
+
+def open_channel(sock, passive, *commands):
+    # commands that have to go before the data command ride along with EPSV/PASV, which
+    # connect to the server now, or with PORT/EPRT, which leave a listener the server
+    # connects to once it has answered the data command
+    if passive:
+        channel, query = None, passive_command(sock)
+    else:
+        channel, query = port_listener(sock)
+    try:
+        replies = transaction(sock, list(commands) + [query])
+        if passive and query == 'EPSV' and refused_epsv(sock, replies[-1]):
+            replies[-1] = command(sock, 'PASV')
+        if passive:
+            channel = connect_data(passive_address(sock, replies[-1]), sock.gettimeout())
+        elif replies[-1].code // 100 != 2:
+            raise ConnectionError('Active mode is not available, try passive: {}'
+                                  .format(replies[-1]))
+    except Exception:
+        if channel is not None:
+            channel.close()
+        raise
+    return channel, replies[:-1]
+
+
+def open_data(sock, compress, *commands, passive=True):
+    # MODE is only sent when the session is not in the wanted mode yet;
+    # returns what start_transfer() takes
+    state = state_of(sock)
+    mode = 'Z' if compress else 'S'
+    switch = [] if state.mode == mode else ['MODE ' + mode]
+    channel, replies = open_channel(sock, passive, *(list(commands) + switch))
+    if switch:
+        if replies[-1].code // 100 != 2:
+            channel.close()
+            raise ConnectionError('Server refused MODE {}: {}'.format(mode, replies[-1]))
+        state.mode = mode
+    return channel
+
+
+def refusal(query, reply):
+    # a data command the server did not start: 5xx refuses the file and the session
+    # goes on, 4xx (421 closing, 425 no data connection, ...) leaves it in doubt
+    if reply.code // 100 != 5:
+        return ConnectionError('{} failed: {}'.format(query, reply))
+    if query.startswith(('STOR', 'APPE')):
+        return PermissionError('{} failed: {}'.format(query, reply))
+    return FileNotFoundError('{} failed: {}'.format(query, reply))
+
+
+def start_transfer(sock, channel, query, passive=True):
+    # returns the data connection, which in active mode the server opens only now
+    reply = command(sock, query)
+    if reply.code not in (125, 150):
+        channel.close()
+        raise refusal(query, reply)
+    if passive:
+        return channel
+    try:
+        return channel.accept()[0]
+    finally:
+        channel.close()
+
+
+def finish_transfer(sock, data_sock, query):
+    data_sock.close()
+    reply = read_reply(sock)
+    if reply.code // 100 != 2:
+        raise ConnectionError('{} failed: {}'.format(query, reply))
+
+
+def list_dir(sock, path, mlsd=False, cache=None, compress=False, passive=True):
+    entries = cache.get(path) if cache is not None else None
+    if entries is not None:
+        return entries
+    query = '{} {}'.format('MLSD' if mlsd else 'LIST', path)
+    channel = open_data(sock, compress, 'TYPE A', passive=passive)
+    data_sock = start_transfer(sock, channel, query, passive)
+    parser = ListParser(mlsd)
+    if compress:
+        receive_inflated(data_sock, parser)
+    else:
+        receive_to_file(data_sock, parser, zero_copy=False)
+    finish_transfer(sock, data_sock, query)
+    entries = parser.close()
+    if cache is not None:
+        cache.put(path, entries)
+    return entries
+
+
+def download(sock, remote_file, local_file, throttle=None, compress=False, passive=True):
+    channel = open_data(sock, compress, 'TYPE I', passive=passive)
+    data_sock = start_transfer(sock, channel, 'RETR ' + remote_file, passive)
+    try:
+        result = open(local_file, 'wb')
+    except OSError:
+        # a local file that cannot be created leaves the session usable
+        data_sock.close()
+        read_reply(sock)
+        raise
+    with result:
+        if compress:
+            received, wire = receive_inflated(data_sock, result, throttle=throttle)
+        else:
+            received = receive_to_file(data_sock, result, throttle=throttle)
+    finish_transfer(sock, data_sock, 'RETR ' + remote_file)
+    return received
+
+
+def upload(sock, local_file, remote_file, throttle=None, compress=False, passive=True):
+    # the local file is opened first, so a missing one costs no commands
+    with open(local_file, 'rb') as file:
+        channel = open_data(sock, compress, 'TYPE I', passive=passive)
+        data_sock = start_transfer(sock, channel, 'STOR ' + remote_file, passive)
+        if compress:
+            sent, wire = send_deflated(data_sock, file, 0, os.fstat(file.fileno()).st_size,
+                                       throttle=throttle)
+        else:
+            sent = send_from_file(data_sock, file, 0, os.fstat(file.fileno()).st_size,
+                                  throttle=throttle)
+    finish_transfer(sock, data_sock, 'STOR ' + remote_file)
+    return sent
+
+
+def prepare_batch(sock, compress, passive):
+    # TYPE and MODE once for the whole batch instead of once per file; queued EPSV
+    # commands cannot fall back one by one, so whether the server knows it is found out
+    # first, and so is whether it takes queued commands at all (a NOOP makes it two)
+    state = state_of(sock)
+    mode = 'Z' if compress else 'S'
+    commands = ['TYPE I'] + ([] if state.mode == mode else ['MODE ' + mode])
+    probe = passive and state.extended is None
+    queries = commands + ['EPSV'] if probe else commands
+    if len(queries) < 2 and state.pipelining is None:
+        queries = queries + ['NOOP']
+    replies = transaction(sock, queries)
+    for query, reply in zip(commands, replies):
+        if reply.code // 100 != 2:
+            raise ConnectionError('{} failed: {}'.format(query, reply))
+    state.mode = mode
+    if probe and not refused_epsv(sock, replies[len(commands)]):
+        passive_address(sock, replies[len(commands)])
+
+
+def pipelined(sock, pairs, results, verb, move, compress, passive, window):
+    # PASV (or PORT with a listener that is already open) and RETR/STOR of the next
+    # files wait at the server while the current file drains, so every file costs
+    # about a round trip instead of a handshake per command; results get
+    # (pair, bytes, error) in order, a file the server refuses does not stop the batch
+    prepare_batch(sock, compress, passive)
+    if state_of(sock).pipelining is False:
+        return lockstep(sock, pairs, results, verb, move, compress, passive)
+    reader = reader_for(sock)
+    pairs = iter(pairs)
+    pending = deque()
+
+    def queue_next():
+        pair = next(pairs, None)
+        if pair is None:
+            return
+        channel, query = (None, passive_command(sock)) if passive else port_listener(sock)
+        command = '{} {}'.format(verb, pair[0] if verb == 'RETR' else pair[1])
+        pending.append((pair, channel, command))
+        sock.sendall(bytes('{}\r\n{}\r\n'.format(query, command), 'ASCII'))
+
+    for i in range(window):
+        queue_next()
+    try:
+        while pending:
+            pair, channel, command = pending.popleft()
+            queue_next()
+            reply = reader.read_reply()
+            if passive and reply.code in (227, 229):
+                try:
+                    channel = connect_data(passive_address(sock, reply), sock.gettimeout())
+                except ConnectionRefusedError:
+                    # the server has refused the file already and moved on to the next EPSV
+                    channel = None
+            elif reply.code // 100 != 2 and channel is not None:
+                channel.close()
+                channel = None
+            reply = reader.read_reply()
+            if reply.code not in (125, 150) or channel is None:
+                if channel is not None:
+                    channel.close()
+                if reply.code in (125, 150):
+                    raise ConnectionError('{} has no data connection'.format(command))
+                error = refusal(command, reply)
+                if type(error) is ConnectionError:
+                    raise error
+                results.append((pair, 0, error))
+                continue
+            data_sock = channel if passive else channel.accept()[0]
+            if not passive:
+                channel.close()
+            try:
+                count = move(data_sock, pair, compress)
+            finally:
+                data_sock.close()
+            reply = reader.read_reply()
+            results.append((pair, count, None if reply.code // 100 == 2 else
+                            ConnectionError('{} failed: {}'.format(command, reply))))
+    finally:
+        for pair, channel, command in pending:
+            if channel is not None:
+                channel.close()
+    return results
+
+
+def lockstep(sock, pairs, results, verb, move, compress, passive):
+    # the same transfers one command at a time, for servers that drop queued commands
+    for pair in pairs:
+        query = '{} {}'.format(verb, pair[0] if verb == 'RETR' else pair[1])
+        channel = open_channel(sock, passive)[0]
+        try:
+            data_sock = start_transfer(sock, channel, query, passive)
+        except (FileNotFoundError, PermissionError) as error:
+            results.append((pair, 0, error))
+            continue
+        try:
+            count = move(data_sock, pair, compress)
+        finally:
+            data_sock.close()
+        reply = read_reply(sock)
+        results.append((pair, count, None if reply.code // 100 == 2 else
+                        ConnectionError('{} failed: {}'.format(query, reply))))
+    return results
+
+
+def download_files(sock, pairs, results=None, throttle=None, compress=False, passive=True,
+                   window=WINDOW):
+    # pairs of (remote, local); a local file is created only once its RETR is accepted
+    def move(data_sock, pair, compress):
+        with open(pair[1], 'wb') as result:
+            if compress:
+                return receive_inflated(data_sock, result, throttle=throttle)[0]
+            return receive_to_file(data_sock, result, throttle=throttle)
+
+    return pipelined(sock, pairs, [] if results is None else results, 'RETR', move,
+                     compress, passive, window)
+
+
+def upload_files(sock, pairs, results=None, throttle=None, compress=False, passive=True,
+                 window=WINDOW):
+    # pairs of (local, remote)
+    def move(data_sock, pair, compress):
+        with open(pair[0], 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if compress:
+                return send_deflated(data_sock, file, 0, size, throttle=throttle)[0]
+            return send_from_file(data_sock, file, 0, size, throttle=throttle)
+
+    return pipelined(sock, pairs, [] if results is None else results, 'STOR', move,
+                     compress, passive, window)
+
+
+def throttled(scheduler, host, transfer, sock, *paths, **options):
+    # options such as compress and passive go to transfer as they are
+    if scheduler is None:
+        return transfer(sock, *paths, **options)
+    stream = scheduler.open(host)
+    try:
+        return transfer(sock, *paths, throttle=stream.throttle, **options)
+    finally:
+        stream.close()
+
+
+def mirror(pool, host, port, user, password, remote_dir, local_dir, workers=WORKERS,
+           mlsd=False, cache=None, scheduler=None, compress=False, passive=True):
+    # directories and files share one work queue, every worker keeps its own session
+    tasks = queue.Queue()
+    lock = threading.Lock()
+    stats = {'files': 0, 'bytes': 0, 'errors': []}
+    tasks.put(('list', remote_dir.rstrip('/') or '/', local_dir))
+
+    def handle(sock, task):
+        kind, remote_path, local_path = task
+        if kind == 'files':
+            results = []
+            try:
+                throttled(scheduler, host, download_files, sock, local_path, results,
+                          compress=compress, passive=passive)
+            except Exception as error:
+                # what is left of the batch failed with the session
+                results.extend((pair, 0, error) for pair in local_path[len(results):])
+                raise
+            finally:
+                count_files(stats, lock, results, 0)
+            return
+        if kind == 'get':
+            received = throttled(scheduler, host, download, sock, remote_path, local_path,
+                                 compress=compress, passive=passive)
+            with lock:
+                stats['files'] += 1
+                stats['bytes'] += received
+            return
+        os.makedirs(local_path, exist_ok=True)
+        small = []
+        for entry in list_dir(sock, remote_path, mlsd, cache, compress, passive):
+            child = '{}/{}'.format(remote_path.rstrip('/'), entry.name)
+            if entry.type == 'dir':
+                tasks.put(('list', child, os.path.join(local_path, entry.name)))
+            elif entry.type == 'file' and entry.size is not None and entry.size <= SMALL_FILE:
+                small.append((child, os.path.join(local_path, entry.name)))
+            elif entry.type == 'file':
+                tasks.put(('get', child, os.path.join(local_path, entry.name)))
+        # batches go to different workers, so one big directory still uses every session
+        for start in range(0, len(small), BATCH):
+            tasks.put(('files', remote_path, small[start:start + BATCH]))
+
+    def worker():
+        sock = None
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            try:
+                if sock is None:
+                    sock = pool.acquire(host, port, user, password)
+                handle(sock, task)
+            except Exception as error:
+                if task[0] != 'files':
+                    with lock:
+                        stats['errors'].append((task[1], error))
+                # a refused file leaves the session as it was, anything else may not have
+                if sock is not None and not isinstance(error, (FileNotFoundError,
+                                                               PermissionError)):
+                    pool.release(sock, broken=True)
+                    sock = None
+            finally:
+                tasks.task_done()
+        if sock is not None:
+            pool.release(sock)
+
+    start_time = time.time()
+    threads = [threading.Thread(target=worker) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    tasks.join()
+    for thread in threads:
+        tasks.put(None)
+    for thread in threads:
+        thread.join()
+    stats['seconds'] = time.time() - start_time
+    return stats
+
+
+def count_files(stats, lock, results, side):
+    # side tells which half of a pair names the file in errors
+    with lock:
+        for pair, count, error in results:
+            if error is None:
+                stats['files'] += 1
+                stats['bytes'] += count
+            else:
+                stats['errors'].append((pair[side], error))
+
+
+def spread(pool, login, pairs, transfer, workers=WORKERS, scheduler=None, compress=False,
+           passive=True):
+    # many small files over several pooled sessions, BATCH files at a time;
+    # transfer is download_files or upload_files, passive=False uses PORT
+    side = 0 if transfer is download_files else 1
+    batches = queue.Queue()
+    for start in range(0, len(pairs), BATCH):
+        batches.put(pairs[start:start + BATCH])
+    lock = threading.Lock()
+    stats = {'files': 0, 'bytes': 0, 'errors': []}
+
+    def worker():
+        sock = None
+        while True:
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                break
+            results = []
+            try:
+                if sock is None:
+                    sock = pool.acquire(*login)
+                throttled(scheduler, login[0], transfer, sock, batch, results,
+                          compress=compress, passive=passive)
+            except Exception as error:
+                # what is left of the batch failed with the session
+                results.extend((pair, 0, error) for pair in batch[len(results):])
+                if sock is not None:
+                    pool.release(sock, broken=True)
+                    sock = None
+            finally:
+                count_files(stats, lock, results, side)
+        if sock is not None:
+            pool.release(sock)
+
+    start_time = time.time()
+    threads = [threading.Thread(target=worker) for i in range(min(workers, batches.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats['seconds'] = time.time() - start_time
+    return stats
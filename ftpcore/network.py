@@ -0,0 +1,186 @@
+import re
+import time
+import errno
+import socket
+import selectors
+import threading
+from .tuning import tune_data
+from .reply import state_of
+
+DNS_TTL = 300
+# an address that refused or timed out is tried after the others for a while
+DEAD_TTL = 60
+ATTEMPT_DELAY = 0.25
+PASV_REG = re.compile(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)')
+EPSV_REG = re.compile(r'\((.)\1\1(\d+)\1\)')
+IN_PROGRESS = (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN)
+RESOLVED = {}
+DEAD = {}
+LOCK = threading.Lock()
+
+
+def resolve(host, port, family=socket.AF_UNSPEC):
+    # getaddrinfo() is slow and blocking, its answer is kept for DNS_TTL seconds;
+    # families alternate (RFC 8305) and recently dead addresses go last
+    key = (host, port, family)
+    now = time.monotonic()
+    with LOCK:
+        cached = RESOLVED.get(key)
+    if cached is None or cached[0] < now:
+        try:
+            infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        except socket.gaierror as error:
+            raise ConnectionError('Address fetching failed: {}:{}: {}'.format(host, port, error))
+        cached = (now + DNS_TTL, interleave(infos))
+        with LOCK:
+            RESOLVED[key] = cached
+    with LOCK:
+        dead = {address for address, until in DEAD.items() if until > now}
+    return sorted(cached[1], key=lambda info: info[4] in dead)
+
+
+def interleave(infos):
+    first = [info for info in infos if info[0] == infos[0][0]]
+    other = [info for info in infos if info[0] != infos[0][0]]
+    result = []
+    for i in range(max(len(first), len(other))):
+        result.extend(first[i:i + 1] + other[i:i + 1])
+    return result
+
+
+def forget(host=None):
+    with LOCK:
+        for key in [key for key in RESOLVED if host is None or key[0] == host]:
+            del RESOLVED[key]
+        if host is None:
+            DEAD.clear()
+
+
+def open_connection(host, port, timeout=None, family=socket.AF_UNSPEC, delay=ATTEMPT_DELAY):
+    # socket.create_connection() that races the addresses Happy Eyeballs style: the next
+    # one starts when the previous has not answered within delay, the first to connect wins
+    infos = resolve(host, port, family)
+    try:
+        return race(infos, timeout, delay)
+    except OSError:
+        # the cached answer may be stale
+        forget(host)
+        raise
+
+
+def race(infos, timeout=None, delay=ATTEMPT_DELAY):
+    selector = selectors.DefaultSelector()
+    pending = list(infos)
+    attempts = {}
+    winner = None
+    error = None
+    now = time.monotonic()
+    deadline = None if timeout is None else now + timeout
+    next_start = now
+    try:
+        while winner is None:
+            now = time.monotonic()
+            if pending and (now >= next_start or not attempts):
+                family, kind, proto, name, address = pending.pop(0)
+                sock = socket.socket(family, kind, proto)
+                sock.setblocking(False)
+                code = sock.connect_ex(address)
+                if code not in IN_PROGRESS:
+                    error = OSError(code, '{}: {}'.format(address[0], errno.errorcode.get(code)))
+                    mark_dead(address)
+                    sock.close()
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE, address)
+                attempts[sock] = address
+                next_start = now + delay
+            if not attempts:
+                raise error or ConnectionError('No address to connect to')
+            if deadline is not None and now >= deadline:
+                for address in attempts.values():
+                    mark_dead(address)
+                raise socket.timeout('Connection timed out')
+            wait = next_start - now if pending else None
+            if deadline is not None:
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+            for key, mask in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                del attempts[sock]
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0 and winner is None:
+                    winner = sock
+                    continue
+                if code:
+                    error = OSError(code, '{}: {}'.format(key.data[0], errno.errorcode.get(code)))
+                    mark_dead(key.data)
+                    # a refused address does not hold the next one back
+                    next_start = now
+                sock.close()
+    finally:
+        for sock in attempts:
+            sock.close()
+        selector.close()
+    winner.setblocking(True)
+    winner.settimeout(timeout)
+    return winner
+
+
+def mark_dead(address):
+    with LOCK:
+        DEAD[address] = time.monotonic() + DEAD_TTL
+
+
+def split_host(text, port=None):
+    # 'host', 'host:port', '[address]' and '[address]:port'; a bare IPv6 address has no port
+    if text.startswith('['):
+        host, _, rest = text[1:].partition(']')
+        return host, int(rest[1:]) if rest.startswith(':') else port
+    if text.count(':') == 1:
+        host, _, number = text.partition(':')
+        return host, int(number)
+    return text, port
+
+
+def passive_command(control_sock):
+    # EPSV works for both families and names no address, so NAT cannot get it wrong
+    return 'PASV' if state_of(control_sock).extended is False else 'EPSV'
+
+
+def refused_epsv(control_sock, reply):
+    # True when the reply to EPSV says the server does not know it, PASV is used from now on
+    if str(reply)[:1] != '5' or control_sock.family == socket.AF_INET6:
+        return False
+    state_of(control_sock).extended = False
+    return True
+
+
+def passive_address(control_sock, reply):
+    # 229 gives only the port, the host is the one the control connection goes to;
+    # 227 gives both, as IPv4 numbers
+    reply = str(reply)
+    numbs = EPSV_REG.search(reply) if reply.startswith('229') else None
+    if numbs is not None:
+        state_of(control_sock).extended = True
+        return control_sock.getpeername()[0], int(numbs.group(2))
+    numbs = PASV_REG.search(reply) if reply.startswith('227') else None
+    if numbs is None:
+        raise ConnectionError('Passive mode is not available: ' + reply.strip())
+    numbs = numbs.groups()
+    return '.'.join(numbs[:4]), int(numbs[4]) * 256 + int(numbs[5])
+
+
+def port_listener(control_sock):
+    # active mode: the server connects back to us, accepted data connections
+    # inherit the buffers of the listening socket; PORT for IPv4, EPRT for IPv6
+    ip_address = control_sock.getsockname()[0]
+    sock = socket.socket(control_sock.family, socket.SOCK_STREAM)
+    tune_data(sock)
+    sock.settimeout(control_sock.gettimeout())
+    sock.bind((ip_address, 0))
+    sock.listen()
+    local_port = sock.getsockname()[1]
+    if control_sock.family == socket.AF_INET6:
+        return sock, 'EPRT |2|{}|{}|'.format(ip_address, local_port)
+    query = 'PORT {},{},{}'.format(ip_address.replace('.', ','),
+                                   local_port // 256, local_port % 256)
+    return sock, query
@@ -0,0 +1,165 @@
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from .reply import read_reply, state_of
+from .tuning import tune_control
+from .network import open_connection
+
+MAX_PER_HOST = 8
+IDLE_TIMEOUT = 300
+KEEPALIVE_INTERVAL = 30
+TIMEOUT = 10
+
+
+class ConnectionPool:
+    # hands out control sockets that are already logged in,
+    # idle ones are kept alive with NOOP until they are needed again
+
+    def __init__(self, max_per_host=MAX_PER_HOST, idle_timeout=IDLE_TIMEOUT,
+                 keepalive=KEEPALIVE_INTERVAL, timeout=TIMEOUT, pipelining=True,
+                 family=socket.AF_UNSPEC):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.timeout = timeout
+        # AF_INET or AF_INET6 to use only one of them, as in FTPSession
+        self.family = family
+        # False sends every command of new sessions in lockstep
+        self.pipelining = pipelining
+        # (host, port) of servers found not to take pipelined commands, so their
+        # new sessions start in lockstep instead of finding out again
+        self.lockstep = set()
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.leased = {}
+        self.limits = {}
+        self.closed = threading.Event()
+        self.thread = None
+
+    def acquire(self, host, port, user, password, timeout=None):
+        key = (host, port, user)
+        limit = self.limit(host, port)
+        if not limit.acquire(timeout=-1 if timeout is None else timeout):
+            raise ConnectionError('Too many sessions to {}:{}'.format(host, port))
+        try:
+            sock = self.take_idle(key)
+            if sock is None:
+                sock = self.open(host, port, user, password)
+        except Exception:
+            limit.release()
+            raise
+        with self.lock:
+            self.leased[sock] = key
+        self.start_keepalive()
+        return sock
+
+    def release(self, sock, broken=False):
+        with self.lock:
+            key = self.leased.pop(sock)
+            if state_of(sock).pipelining is False:
+                self.lockstep.add(key[:2])
+            if not broken and not self.closed.is_set():
+                self.idle.setdefault(key, []).append((sock, time.time(), time.time()))
+        if broken or self.closed.is_set():
+            self.quit(sock)
+        self.limit(key[0], key[1]).release()
+
+    @contextmanager
+    def session(self, host, port, user, password):
+        sock = self.acquire(host, port, user, password)
+        try:
+            yield sock
+        except (FileNotFoundError, PermissionError):
+            # the server refused one file, the session itself is fine
+            self.release(sock)
+            raise
+        except Exception:
+            self.release(sock, broken=True)
+            raise
+        self.release(sock)
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            idle = [sock for sessions in self.idle.values() for sock, used, checked in sessions]
+            self.idle.clear()
+        for sock in idle:
+            self.quit(sock)
+
+    def limit(self, host, port):
+        with self.lock:
+            if (host, port) not in self.limits:
+                self.limits[(host, port)] = threading.BoundedSemaphore(self.max_per_host)
+            return self.limits[(host, port)]
+
+    def take_idle(self, key):
+        while True:
+            with self.lock:
+                sessions = self.idle.get(key)
+                if not sessions:
+                    return None
+                sock, used, checked = sessions.pop()
+            if time.time() - used < self.idle_timeout:
+                return sock
+            self.quit(sock)
+
+    def open(self, host, port, user, password):
+        sock = open_connection(host, port, self.timeout, self.family)
+        tune_control(sock)
+        try:
+            reply = read_reply(sock)
+            if not reply.ok():
+                raise ConnectionError('Server refused connection: {}'.format(reply))
+            sock.sendall(bytes('USER {}\r\n'.format(user), 'ASCII'))
+            reply = read_reply(sock)
+            if reply.code == 331:
+                sock.sendall(bytes('PASS {}\r\n'.format(password), 'ASCII'))
+                reply = read_reply(sock)
+            if reply.code // 100 != 2:
+                raise ValueError('Login is incorrect: {}'.format(reply))
+        except Exception:
+            sock.close()
+            raise
+        with self.lock:
+            lockstep = not self.pipelining or (host, port) in self.lockstep
+        if lockstep:
+            state_of(sock).pipelining = False
+        return sock
+
+    def quit(self, sock):
+        try:
+            sock.sendall(b'QUIT\r\n')
+        except OSError:
+            pass
+        sock.close()
+
+    def start_keepalive(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.keep_alive, daemon=True)
+        self.thread.start()
+
+    def keep_alive(self):
+        while not self.closed.wait(min(self.keepalive, self.idle_timeout) / 2):
+            now = time.time()
+            with self.lock:
+                due = [(key, session) for key, sessions in self.idle.items()
+                       for session in sessions if now - session[2] >= self.keepalive
+                       or now - session[1] >= self.idle_timeout]
+                for key, session in due:
+                    self.idle[key].remove(session)
+            for key, (sock, used, checked) in due:
+                if now - used >= self.idle_timeout:
+                    self.quit(sock)
+                    continue
+                try:
+                    sock.sendall(b'NOOP\r\n')
+                    if not read_reply(sock).ok():
+                        raise ConnectionError('NOOP failed')
+                except (OSError, ConnectionError):
+                    sock.close()
+                    continue
+                with self.lock:
+                    self.idle.setdefault(key, []).append((sock, used, time.time()))
@@ -0,0 +1,195 @@
+import re
+import json
+import time
+import queue
+import socket
+import threading
+from urllib.parse import urlsplit
+from .session import FTPSession
+from .reply import state_of
+from .tuning import tune_control
+from .network import open_connection, split_host
+
+WORKERS = 16
+STAGES = ('connect', 'banner', 'login', 'list')
+# seconds a stage may take as a whole, not per recv(), so a server that trickles
+# its banner a byte at a time still fails in time
+TIMEOUTS = {'connect': 5, 'banner': 5, 'login': 10, 'list': 10}
+LABEL_REG = re.compile(r'^[^\s:]+:\s+(\S+)$')
+HOST_REG = re.compile(r'^([A-Za-z0-9]([A-Za-z0-9.-]*[A-Za-z0-9])?|[0-9A-Fa-f.]*:[0-9A-Fa-f:.]*)$')
+
+
+def load_hosts(filename, port=21):
+    # one server per line: host, host:port, [v6]:port, ftp://host[:port]/path or
+    # 'name: address'; anything else, such as pasted listings, is skipped
+    hosts = []
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '://' in line:
+                url = urlsplit(line)
+                if url.scheme.lower() != 'ftp' or not url.hostname:
+                    continue
+                target = (url.hostname, url.port or port)
+            else:
+                match = LABEL_REG.match(line)
+                if match is not None:
+                    line = match.group(1)
+                if len(line.split()) != 1:
+                    continue
+                try:
+                    target = split_host(line, port)
+                except ValueError:
+                    continue
+            if HOST_REG.match(target[0]) and target not in hosts:
+                hosts.append(target)
+    return hosts
+
+
+class Watchdog:
+    # shuts the control connection down when a stage runs out of time,
+    # which wakes up whatever recv() the stage is blocked in
+
+    def __init__(self, session, timeouts):
+        self.session = session
+        self.timeouts = timeouts
+        self.timer = None
+        self.fired = False
+
+    def stage(self, name):
+        self.cancel()
+        limit = self.timeouts[name]
+        # blocking calls give up on their own too, the timer covers slow trickles
+        self.session.timeout = limit
+        if self.session.sock is not None:
+            self.session.sock.settimeout(limit)
+        self.timer = threading.Timer(limit, self.expire)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def expire(self):
+        self.fired = True
+        sock = self.session.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+def probe(host, port=21, user='anonymous', password='example@mail.com', timeouts=TIMEOUTS,
+          passive=True, family=socket.AF_UNSPEC):
+    # connect, banner, login and the first listing, each timed in milliseconds;
+    # 'stage' names where a failed probe stopped
+    result = {'host': host, 'port': port, 'ok': False, 'stage': None, 'error': None,
+              'address': None, 'banner': None, 'features': [], 'entries': None,
+              'latency': dict((name, None) for name in STAGES), 'total': None}
+    session = FTPSession(host, port, passive=passive, family=family)
+    session.compress = False
+    watchdog = Watchdog(session, timeouts)
+    stage = None
+    try:
+        for stage in STAGES:
+            watchdog.stage(stage)
+            started = time.monotonic()
+            if stage == 'connect':
+                sock = open_connection(host, port, timeouts['connect'], family)
+                tune_control(sock)
+                session.sock = sock
+                session.state = state_of(sock)
+                result['address'] = sock.getpeername()[0]
+            elif stage == 'banner':
+                reply = session.receive()
+                result['banner'] = reply.strip()
+                if not reply.startswith('2'):
+                    raise ConnectionError('Server refused connection: ' + reply.strip())
+            elif stage == 'login':
+                session.login(user, password)
+            else:
+                result['entries'] = len(session.listing())
+            result['latency'][stage] = round((time.monotonic() - started) * 1000, 1)
+            if watchdog.fired:
+                raise socket.timeout('timed out')
+        # the listing has asked FEAT already, keywords only
+        result['features'] = sorted(feature for feature in session.features()
+                                    if ' ' not in feature)
+        result['ok'] = True
+        result['total'] = round(sum(result['latency'].values()), 1)
+    except Exception as error:
+        result['stage'] = stage
+        result['error'] = 'timed out' if watchdog.fired else str(error).strip()
+    finally:
+        watchdog.cancel()
+        if result['ok']:
+            session.quit()
+        else:
+            session.close()
+    return result
+
+
+def probe_all(hosts, user='anonymous', password='example@mail.com', workers=WORKERS,
+              timeouts=TIMEOUTS, passive=True, family=socket.AF_UNSPEC, report=None):
+    # at most workers hosts are probed at once, results come back ranked
+    tasks = queue.Queue()
+    results = []
+    lock = threading.Lock()
+    for host, port in hosts:
+        tasks.put((host, port))
+
+    def worker():
+        while True:
+            try:
+                host, port = tasks.get_nowait()
+            except queue.Empty:
+                return
+            result = probe(host, port, user, password, timeouts, passive, family)
+            with lock:
+                results.append(result)
+            if report is not None:
+                report(result)
+
+    threads = [threading.Thread(target=worker) for i in range(max(min(workers, len(hosts)), 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return rank(results)
+
+
+def rank(results):
+    # healthy servers by total latency, then the failed ones by how far they got
+    def key(result):
+        if result['ok']:
+            return 0, result['total'], result['host']
+        return 1, -STAGES.index(result['stage']), result['host']
+    return sorted(results, key=key)
+
+
+def summary(results, seconds):
+    healthy = [result for result in results if result['ok']]
+    lines = ['{} servers in {:.1f} s: {} healthy, {} failed'.format(
+        len(results), seconds, len(healthy), len(results) - len(healthy))]
+    for place, result in enumerate(results, 1):
+        name = ('[{}]:{}' if ':' in result['host'] else '{}:{}').format(result['host'],
+                                                                        result['port'])
+        if result['ok']:
+            times = '  '.join('{} {:.0f}'.format(stage, result['latency'][stage])
+                              for stage in STAGES)
+            lines.append('{:>3} {:<30} ok    {:>7.0f} ms  ({})  {}'.format(
+                place, name, result['total'], times, ' '.join(result['features'])))
+        else:
+            lines.append('{:>3} {:<30} FAIL  {}: {}'.format(
+                place, name, result['stage'], result['error']))
+    return '\n'.join(lines), bool(healthy)
+
+
+def export(results, filename, seconds=None):
+    with open(filename, 'w') as file:
+        json.dump({'time': time.time(), 'seconds': seconds, 'servers': results}, file, indent=2)
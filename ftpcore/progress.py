@@ -0,0 +1,126 @@
+import sys
+import json
+import math
+import time
+
+REFRESH_INTERVAL = 0.25
+SPEED_WINDOW = 3.0
+UNITS = ['B/s', 'KB/s', 'MB/s', 'GB/s']
+
+
+def convert_speed(speed):
+    unit_index = 0
+    while speed > 1024 and unit_index < len(UNITS) - 1:
+        speed /= 1024
+        unit_index += 1
+    return '{:.1f}{}'.format(speed, UNITS[unit_index])
+
+
+class Transfer:
+    # progress of one transfer; sinks hear about it at most once per interval,
+    # speed is a moving average over about SPEED_WINDOW seconds
+
+    def __init__(self, name, total, sink, interval=REFRESH_INTERVAL):
+        self.name = name
+        self.total = total
+        self.sink = sink
+        self.interval = interval
+        self.done = 0
+        self.speed = 0.0
+        self.start_time = self.last_time = time.monotonic()
+        self.last_done = 0
+        self.tuning = None
+        self.sink.emit('start', self)
+
+    def update(self, done):
+        self.done = done
+        now = time.monotonic()
+        if now - self.last_time < self.interval:
+            return
+        self.measure(now)
+        self.sink.emit('progress', self)
+
+    def finish(self, tuning=None):
+        # tuning: socket buffers and chunk sizes the transfer ended up with
+        self.tuning = tuning
+        self.measure(time.monotonic())
+        elapsed = self.last_time - self.start_time
+        if elapsed > 0:
+            self.speed = self.done / elapsed
+        self.sink.emit('finish', self)
+
+    def measure(self, now):
+        elapsed = now - self.last_time
+        if elapsed <= 0:
+            return
+        rate = (self.done - self.last_done) / elapsed
+        if self.last_done == 0 and self.speed == 0:
+            self.speed = rate
+        else:
+            weight = 1 - math.exp(-elapsed / SPEED_WINDOW)
+            self.speed += weight * (rate - self.speed)
+        self.last_time = now
+        self.last_done = self.done
+
+    def eta(self):
+        if not self.total or self.speed <= 0:
+            return None
+        return max(self.total - self.done, 0) / self.speed
+
+
+class TtySink:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def emit(self, event, transfer):
+        if event == 'start':
+            return
+        total = transfer.total or transfer.done or 1
+        filled_length = int(round(min(transfer.done / total, 1) * 20))
+        bar = '█' * filled_length + '_' * (20 - filled_length)
+        eta = transfer.eta()
+        self.stream.write('\rProgress: [{}] {:.1%} complete; '
+                          'speed:{}; '
+                          '{} seconds left'
+                          .format(bar, transfer.done / total, convert_speed(transfer.speed),
+                                  '?' if eta is None else int(eta)))
+        if event == 'finish':
+            self.stream.write('\n')
+            if transfer.tuning:
+                self.stream.write('Tuning: {}\n'.format(', '.join(
+                    '{} {}'.format(key, value) for key, value in sorted(transfer.tuning.items()))))
+            self.stream.write('\n')
+        self.stream.flush()
+
+
+class QuietSink:
+    def emit(self, event, transfer):
+        pass
+
+
+class JsonSink:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def emit(self, event, transfer):
+        eta = transfer.eta()
+        record = {'event': event, 'name': transfer.name,
+                  'done': transfer.done, 'total': transfer.total,
+                  'speed': round(transfer.speed, 1),
+                  'eta': None if eta is None else round(eta, 1),
+                  'time': round(time.time(), 3)}
+        if event == 'finish' and transfer.tuning:
+            record['tuning'] = transfer.tuning
+        self.stream.write(json.dumps(record) + '\n')
+        self.stream.flush()
+
+
+SINKS = {'tty': TtySink, 'quiet': QuietSink, 'json': JsonSink}
+
+
+def make_sink(kind=None):
+    if kind is None:
+        kind = 'tty' if sys.stdout.isatty() else 'quiet'
+    if kind not in SINKS:
+        raise ValueError('Progress output is one of: {}'.format(', '.join(sorted(SINKS))))
+    return SINKS[kind]()
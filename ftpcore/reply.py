@@ -0,0 +1,152 @@
+import socket
+import weakref
+from collections import deque, namedtuple
+from .exceptions import PipelineError
+
+ENCODING = 'UTF-8'
+BUFFER_SIZE = 65535
+# what servers that do not take queued commands answer them with
+REJECTED = (500, 503)
+
+
+class Reply(namedtuple('Reply', ['code', 'lines'])):
+    __slots__ = ()
+
+    def __str__(self):
+        return '\r\n'.join(self.lines) + '\r\n'
+
+    def ok(self):
+        return self.code < 400
+
+
+# received bytes are kept between calls, so replies that arrive together
+# or split over many segments come out whole and in order
+class ReplyReader:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.start = 0
+        self.code = None
+        self.lines = []
+        self.replies = deque()
+
+    def read_reply(self):
+        while not self.replies:
+            data = self.sock.recv(BUFFER_SIZE)
+            if not data:
+                raise ConnectionError('Connection closed by server')
+            self.feed(data)
+        return self.replies.popleft()
+
+    def pending(self):
+        return len(self.replies)
+
+    def feed(self, data):
+        self.buffer += data
+        while True:
+            end = self.buffer.find(b'\n', self.start)
+            if end < 0:
+                break
+            line = bytes(self.buffer[self.start:end]).rstrip(b'\r')
+            self.start = end + 1
+            self.parse_line(line.decode(ENCODING, 'replace'))
+        if self.start > BUFFER_SIZE or self.start == len(self.buffer):
+            del self.buffer[:self.start]
+            self.start = 0
+
+    def parse_line(self, line):
+        self.lines.append(line)
+        code = line[:3]
+        if self.code is None:
+            if not code.isdigit():
+                # garbage outside of a reply sticks to the next one
+                return
+            if line[3:4] == '-':
+                self.code = code
+                return
+        elif not (line.startswith(self.code) and line[3:4] == ' '):
+            return
+        self.replies.append(Reply(int(code), self.lines))
+        self.code = None
+        self.lines = []
+
+
+class ControlState:
+    # everything known about one control connection: replies read ahead, the transfer
+    # mode and, once found out, whether the server answers pipelined commands and knows
+    # EPSV. FTPSession and the helpers that work on bare sockets share it, so a socket
+    # can go from one to the other without either working from a stale copy
+    __slots__ = ('reader', 'mode', 'pipelining', 'extended')
+
+    def __init__(self, sock):
+        self.reader = ReplyReader(sock)
+        self.mode = 'S'
+        self.pipelining = None
+        self.extended = None
+
+
+_states = weakref.WeakKeyDictionary()
+
+
+def state_of(sock):
+    state = _states.get(sock)
+    if state is None:
+        state = _states[sock] = ControlState(sock)
+    return state
+
+
+def reader_for(sock):
+    return state_of(sock).reader
+
+
+def read_reply(sock):
+    return reader_for(sock).read_reply()
+
+
+def pipeline(sock, commands):
+    # all commands leave in one segment, replies are matched to them in order
+    sock.sendall(b''.join(bytes('{}\r\n'.format(command), 'ASCII') for command in commands))
+    reader = reader_for(sock)
+    replies = []
+    try:
+        while len(replies) < len(commands):
+            replies.append(reader.read_reply())
+    except socket.timeout:
+        raise PipelineError('Server stopped answering pipelined commands', replies)
+    return replies
+
+
+def transaction(sock, commands, pipelined=True):
+    # pipeline() that finds out whether the server takes queued commands. Until that is
+    # known, commands answered with 500/503 are sent again one by one, and a different
+    # answer then means the queue was the problem; a server that drops them silently
+    # is found out by the timeout. Either way it gets every command in lockstep from
+    # then on, as it does with pipelined=False
+    state = state_of(sock)
+    replies = []
+    rejected = None
+    if pipelined and state.pipelining is not False:
+        try:
+            replies = pipeline(sock, commands)
+        except PipelineError as error:
+            state.pipelining = False
+            replies = list(error.replies)
+        else:
+            if state.pipelining is not None or len(commands) < 2:
+                return replies
+            for index, reply in enumerate(replies[1:], 1):
+                if reply.code in REJECTED:
+                    rejected = index, reply.code
+                    replies = replies[:index]
+                    break
+            else:
+                state.pipelining = True
+                return replies
+    reader = state.reader
+    for command in commands[len(replies):]:
+        sock.sendall(bytes('{}\r\n'.format(command), 'ASCII'))
+        replies.append(reader.read_reply())
+    if rejected is not None:
+        index, code = rejected
+        state.pipelining = replies[index].code == code
+    return replies
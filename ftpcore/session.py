@@ -0,0 +1,718 @@
+import io
+import os
+import re
+import time
+import socket
+import threading
+from .reply import state_of, reader_for, transaction
+from .exceptions import NotChangedDirectoryError, ChecksumError, TransferError
+from .tuning import tune_control, connect_data, buffers
+from .network import open_connection, passive_command, refused_epsv, passive_address
+from .network import port_listener
+from .metrics import SessionMetrics
+
+TIMEOUT = 10
+MIN_SEGMENT_SIZE = 1024 * 1024
+# compiled once, every reply of every session goes through them
+NUMBER_REG = re.compile(r'213 (\d+)')
+PATH_REG = re.compile(r'"(.+)"')
+
+
+class FTPSession:
+    # one logged-in control connection with its transfer mode, features and working
+    # directory. Modules that only transfers need are imported on first use, so a
+    # process that embeds the client pays for what it calls
+
+    __slots__ = ('host', 'port', 'family', 'user', 'password', 'timeout', 'sock', 'state',
+                 'passive', 'pipelining', 'zero_copy', 'compress', 'verify', 'segments',
+                 'priority', 'feature_set', 'cwd', 'pool', 'own_pool', 'scheduler',
+                 'cache', 'metrics', 'sink', 'notify')
+
+    def __init__(self, host, port=21, timeout=TIMEOUT, passive=True, pool=None,
+                 scheduler=None, cache=None, metrics=None, sink=None, notify=None,
+                 family=socket.AF_UNSPEC):
+        self.host = host
+        self.port = port
+        # AF_INET or AF_INET6 to use only one of them
+        self.family = family
+        self.user = None
+        self.password = None
+        self.timeout = timeout
+        self.sock = None
+        # reader, transfer mode and what the server showed, kept with the socket (reply.py)
+        self.state = None
+        self.passive = passive
+        # False sends every command in lockstep, whatever the server can do
+        self.pipelining = True
+        self.zero_copy = True
+        self.compress = True
+        self.verify = None
+        self.segments = 1
+        self.priority = 1
+        self.feature_set = None
+        self.cwd = None
+        # pool, scheduler and sink are created when a transfer first needs them
+        self.pool = pool
+        self.own_pool = False
+        self.scheduler = scheduler
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else SessionMetrics()
+        self.sink = sink
+        # called with messages a person would want to see, None keeps quiet
+        self.notify = notify
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.quit()
+
+    def say(self, message):
+        if self.notify is not None:
+            self.notify(message)
+
+    def connect(self):
+        with self.metrics.timer('connect'):
+            sock = open_connection(self.host, self.port, self.timeout, self.family)
+            tune_control(sock)
+            self.sock = sock
+            self.state = state_of(sock)
+            reply = self.receive()
+        if not reply.startswith('2'):
+            self.close()
+            raise ConnectionError('Server refused connection: ' + reply)
+        return reply
+
+    def login(self, user, password):
+        with self.metrics.timer('login'):
+            reply = self.command('USER', user)
+            if reply.startswith('3'):
+                reply = self.command('PASS', password)
+        if not reply.startswith('2'):
+            raise ValueError('Login is incorrect: ' + reply.strip())
+        self.user = user
+        self.password = password
+        self.cwd = None
+        if self.cache is not None:
+            self.cache.clear()
+        return reply
+
+    def quit(self):
+        if self.sock is None:
+            return
+        try:
+            self.command('QUIT')
+        except OSError:
+            pass
+        self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.own_pool:
+            self.pool.close()
+            self.pool = None
+            self.own_pool = False
+
+    def send(self, command, argument=None):
+        if argument is not None:
+            query = '{} {}\r\n'.format(command, argument)
+        else:
+            query = '{}\r\n'.format(command)
+        self.metrics.command_sent(self.sock, query.rstrip())
+        self.sock.sendall(bytes(query, 'ASCII'))
+
+    def read(self):
+        reply = self.state.reader.read_reply()
+        self.metrics.reply_received(self.sock, reply)
+        return reply
+
+    def receive(self):
+        return str(self.read())
+
+    def command(self, command, argument=None):
+        self.send(command, argument)
+        return self.receive()
+
+    def transaction(self, *commands):
+        # reply.transaction() with this session's metrics; commands sent again after
+        # a failed pipeline are answered in the order they were first counted
+        known = self.state.pipelining
+        for command in commands:
+            self.metrics.command_sent(self.sock, command)
+        replies = transaction(self.sock, commands, self.pipelining)
+        for reply in replies:
+            self.metrics.reply_received(self.sock, reply)
+        if known is not False and self.state.pipelining is False:
+            self.say('Server does not answer pipelined commands, switching to lockstep')
+        return [str(reply) for reply in replies]
+
+    def features(self):
+        if self.feature_set is None:
+            self.send('FEAT')
+            reply = self.read()
+            # keywords such as 'MLST' and whole lines such as 'MODE Z'
+            self.feature_set = set()
+            for line in reply.lines[1:-1] if reply.code == 211 else []:
+                words = line.upper().split()
+                if words:
+                    self.feature_set.update((words[0], ' '.join(words)))
+        return self.feature_set
+
+    def compressed(self, allowed=True):
+        # MODE Z when the server offers it, MODE S otherwise; the mode stays for later transfers
+        wanted = allowed and self.compress and 'MODE Z' in self.features()
+        mode = 'Z' if wanted else 'S'
+        if self.state.mode != mode:
+            reply = self.command('MODE', mode)
+            if not reply.startswith('2'):
+                if wanted:
+                    # announced but refused, do not ask again
+                    self.feature_set.discard('MODE Z')
+                    return False
+                raise ConnectionError('Server cannot return to MODE S: ' + reply)
+            self.state.mode = mode
+        return wanted
+
+    def set_type(self, name):
+        return self.command('TYPE', name)
+
+    def pwd(self):
+        return self.command('PWD')
+
+    def working_dir(self):
+        if self.cwd is None:
+            self.cwd = PATH_REG.findall(self.pwd())[0]
+        return self.cwd
+
+    def change_dir(self, path):
+        reply = self.command('CWD', path)
+        # relative paths resolve against the new directory from now on
+        self.cwd = None
+        if not reply.startswith('2'):
+            raise NotChangedDirectoryError('Cannot change directory')
+        return reply
+
+    def remote_path(self, path):
+        from .listing import normalize
+        if path is None:
+            return self.working_dir()
+        if path.startswith('/'):
+            return normalize(path)
+        return normalize('{}/{}'.format(self.working_dir(), path))
+
+    def size(self, filename, cached=True):
+        if cached and self.cache is not None:
+            entry = self.cache.lookup(self.remote_path(filename))
+            if entry is not None and entry.type == 'file' and entry.size is not None:
+                return entry.size
+        result = NUMBER_REG.match(self.command('SIZE', filename))
+        return int(result.group(1)) if result else None
+
+    def modification_time(self, filename):
+        result = NUMBER_REG.match(self.command('MDTM', filename))
+        return result.group(1) if result else None
+
+    def open_data(self, *commands):
+        # commands that have to go first ride along with PASV or PORT; returns the data
+        # socket (passive) or the listening socket (active) and the replies to commands
+        if self.passive:
+            channel, query = None, passive_command(self.sock)
+        else:
+            channel, query = port_listener(self.sock)
+        try:
+            replies = self.transaction(*(commands + (query,)))
+            if self.passive and query == 'EPSV' and refused_epsv(self.sock, replies[-1]):
+                replies[-1] = self.command('PASV')
+            if self.passive:
+                channel = self.passive_connect(replies[-1])
+            elif not replies[-1].startswith('2'):
+                raise ConnectionError('Active mode is not available, try passive: '
+                                      + replies[-1])
+        except Exception:
+            if channel is not None:
+                channel.close()
+            raise
+        return channel, replies[:-1]
+
+    def passive_connect(self, reply):
+        with self.metrics.timer('data.setup'):
+            return connect_data(passive_address(self.sock, reply), self.timeout)
+
+    def start(self, channel, command, argument):
+        # the data connection is ready once the server has answered 125 or 150;
+        # returns None instead of it when the server refused the command
+        reply = self.command(command, argument)
+        if not reply.startswith('150') and not reply.startswith('125'):
+            channel.close()
+            return None, reply
+        return self.accept(channel), reply
+
+    def accept(self, channel):
+        # in active mode the server connects back once it has answered
+        if self.passive:
+            return channel
+        with self.metrics.timer('data.setup'):
+            data_sock, address = channel.accept()
+        channel.close()
+        return data_sock
+
+    def session_pool(self):
+        if self.pool is None:
+            from .pool import ConnectionPool
+            # pooled sessions wait as long as this one and follow its --lockstep and -4/-6
+            lockstep = self.state is not None and self.state.pipelining is False
+            self.pool = ConnectionPool(timeout=self.timeout,
+                                       pipelining=self.pipelining and not lockstep,
+                                       family=self.family)
+            self.own_pool = True
+        return self.pool
+
+    def limiter(self):
+        if self.scheduler is None:
+            from .bandwidth import Scheduler
+            self.scheduler = Scheduler()
+        return self.scheduler
+
+    def open_stream(self):
+        return self.limiter().open(self.host, self.priority)
+
+    def progress(self, name, total):
+        from .progress import Transfer, QuietSink
+        if self.sink is None:
+            self.sink = QuietSink()
+        return Transfer(name, total, self.sink)
+
+    def tuning_report(self, kind, sizer, data_sock):
+        # read before the data socket is closed, the kernel may have grown its buffers
+        report = dict(sizer.summary(), **buffers(data_sock))
+        self.metrics.observe(kind + '.chunk', report['chunk'])
+        self.metrics.add('syscalls.' + kind, report['syscalls'])
+        return report
+
+    def get(self, remote_file, local_file=None):
+        from .datapath import receive_to_file, receive_inflated
+        from .tuning import ChunkSizer
+        from .checksum import Digest
+        from .journal import save_journal, remove_journal
+        if local_file is None:
+            local_file = os.path.join(os.getcwd(), os.path.basename(remote_file))
+        channel, replies = self.open_data('TYPE I', 'SIZE ' + remote_file, 'MDTM ' + remote_file)
+        result = NUMBER_REG.match(replies[1])
+        if result is None:
+            channel.close()
+            raise FileNotFoundError('Couldn\'t download file {}'.format(remote_file))
+        file_size = int(result.group(1))
+        result = NUMBER_REG.match(replies[2])
+        modify = result.group(1) if result else None
+        # segments arrive out of order, a running digest needs the whole stream
+        if self.segments > 1 and file_size >= self.segments * MIN_SEGMENT_SIZE \
+                and self.verify is None:
+            channel.close()
+            return self.segmented_get(remote_file, local_file, file_size)
+        compress = self.compressed()
+        started = time.monotonic()
+        data_sock, reply = self.start(channel, 'RETR', remote_file)
+        if data_sock is None:
+            raise FileNotFoundError('Couldn\'t download file {}'.format(remote_file))
+        transfer = self.progress(remote_file, file_size)
+        phase = self.metrics.data_phase('get', started, transfer.update)
+        digest = Digest(self.verify) if self.verify else None
+        sizer = ChunkSizer()
+        stream = self.open_stream()
+        try:
+            # written before the first byte, so reget can take over from a broken download
+            save_journal(local_file, remote=remote_file, size=file_size, modify=modify)
+            with open(local_file, 'wb') as result:
+                if compress:
+                    received, wire = receive_inflated(data_sock, result, phase,
+                                                      stream.throttle, digest, sizer)
+                    self.metrics.add('wire.get', wire)
+                else:
+                    received = receive_to_file(data_sock, result, file_size, phase,
+                                               self.zero_copy, stream.throttle, digest, sizer)
+            phase.finish()
+            transfer.finish(self.tuning_report('get', sizer, data_sock))
+        finally:
+            stream.close()
+            # the completion reply is read even after a failure, or the next command gets it
+            data_sock.close()
+            reply = self.receive()
+        if not reply.startswith('2') or received != file_size:
+            raise TransferError('Download of {} failed after {} of {} bytes: {}'
+                                .format(remote_file, received, file_size, reply.strip()), reply)
+        remove_journal(local_file)
+        if digest is not None:
+            self.check_digest(digest, self.server_checksum(remote_file)
+                              or self.remote_sidecar(remote_file), remote_file)
+        return reply
+
+    def segmented_get(self, remote_file, local_file, file_size):
+        with open(local_file, 'wb') as result:
+            result.truncate(file_size)
+        segments = self.segments
+        part = file_size // segments
+        bounds = [(i * part, part) for i in range(segments - 1)]
+        bounds.append(((segments - 1) * part, file_size - (segments - 1) * part))
+        lock = threading.Lock()
+        progress = {'received': 0, 'errors': []}
+        transfer = self.progress(remote_file, file_size)
+        stream = self.open_stream()
+
+        def report(count):
+            with lock:
+                progress['received'] += count
+                transfer.update(progress['received'])
+            stream.throttle(count)
+
+        def worker(offset, length):
+            try:
+                self.get_segment(remote_file, local_file, offset, length, report)
+            except Exception as error:
+                progress['errors'].append(error)
+
+        threads = [threading.Thread(target=worker, args=bound) for bound in bounds]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stream.close()
+        transfer.finish()
+        if progress['errors']:
+            raise ConnectionError('Segmented download of {} failed: {}'
+                                  .format(remote_file, progress['errors'][0]))
+        return 'Downloaded {} in {} segments'.format(remote_file, segments)
+
+    def get_segment(self, remote_file, local_file, offset, length, report):
+        # every segment gets its own pooled control connection in this session's data mode;
+        # pooled sessions may have been left in MODE Z by batches, open_data puts them back
+        from .datapath import receive_to_file, receive_to_mmap
+        from .mirror import open_data, command, start_transfer
+        pool = self.session_pool()
+        sock = pool.acquire(self.host, self.port, self.user, self.password)
+        try:
+            channel = open_data(sock, False, 'TYPE I', passive=self.passive)
+            reply = command(sock, 'REST {}'.format(offset))
+            if reply.code != 350:
+                channel.close()
+                raise ConnectionError('Server does not support REST: {}'.format(reply))
+            data_sock = start_transfer(sock, channel, 'RETR ' + remote_file, self.passive)
+            done = [0]
+
+            def progress(received):
+                report(received - done[0])
+                done[0] = received
+
+            with open(local_file, 'r+b') as result:
+                if self.zero_copy:
+                    received = receive_to_mmap(data_sock, result, offset, length, progress)
+                else:
+                    result.seek(offset)
+                    received = receive_to_file(data_sock, result, length, progress, False)
+            # the rest of the file belongs to other segments, so the transfer is aborted
+            data_sock.close()
+            reader_for(sock).read_reply()
+            if received < length:
+                raise ConnectionError('Segment at {} is incomplete'.format(offset))
+        except Exception:
+            pool.release(sock, broken=True)
+            raise
+        pool.release(sock)
+
+    def put(self, local_file, remote_name=None):
+        from .datapath import send_from_file, send_deflated
+        from .tuning import ChunkSizer
+        from .checksum import Digest
+        from .journal import save_journal, remove_journal, local_state
+        if remote_name is None:
+            remote_name = os.path.basename(local_file)
+        file_size = os.path.getsize(local_file)
+        channel, replies = self.open_data('TYPE I')
+        if self.cache is not None:
+            self.cache.invalidate_parent(self.remote_path(remote_name))
+        compress = self.compressed()
+        started = time.monotonic()
+        data_sock, reply = self.start(channel, 'STOR', remote_name)
+        if data_sock is None:
+            raise PermissionError('You have no permission to store {}: {}'
+                                  .format(remote_name, reply.strip()))
+        transfer = self.progress(local_file, file_size)
+        phase = self.metrics.data_phase('put', started, transfer.update)
+        digest = Digest(self.verify) if self.verify else None
+        sizer = ChunkSizer()
+        stream = self.open_stream()
+        try:
+            # what reput needs to trust the part of the file that did arrive
+            save_journal(local_file, remote=remote_name, **local_state(local_file))
+            with open(local_file, 'rb') as file:
+                if compress:
+                    sent, wire = send_deflated(data_sock, file, 0, file_size, phase,
+                                               stream.throttle, digest, sizer)
+                    self.metrics.add('wire.put', wire)
+                else:
+                    sent = send_from_file(data_sock, file, 0, file_size, phase, self.zero_copy,
+                                          stream.throttle, digest, sizer)
+            phase.finish()
+            transfer.finish(self.tuning_report('put', sizer, data_sock))
+        finally:
+            stream.close()
+            # the completion reply is read even after a failure, or the next command gets it
+            data_sock.close()
+            reply = self.receive()
+        if not reply.startswith('2'):
+            raise TransferError('Upload of {} failed after {} of {} bytes: {}'
+                                .format(remote_name, sent, file_size, reply.strip()), reply)
+        remove_journal(local_file)
+        if digest is not None:
+            # what the server stored, or what the local sidecar says we should have sent
+            self.check_digest(digest, self.server_checksum(remote_name)
+                              or local_sidecar(local_file, self.verify), remote_name)
+        return reply
+
+    def copy_to(self, target, remote_file, target_name=None, wait=None):
+        # server to server, the data does not pass through this client
+        from .fxp import copy
+        return copy(self, target, remote_file, target_name, wait)
+
+    def get_many(self, remote_files, local_dir=None):
+        # small files in pipelined batches over several pooled sessions,
+        # returns the statistics of mirror.spread()
+        from .mirror import spread, download_files, WORKERS
+        local_dir = local_dir or os.getcwd()
+        pairs = [(self.remote_path(name), os.path.join(local_dir, name.rsplit('/', 1)[-1]))
+                 for name in remote_files]
+        return spread(self.session_pool(), (self.host, self.port, self.user, self.password),
+                      pairs, download_files, max(self.segments, WORKERS), self.scheduler,
+                      self.compress and 'MODE Z' in self.features(), self.passive)
+
+    def put_many(self, local_files, remote_dir=None):
+        from .mirror import spread, upload_files, WORKERS
+        remote_dir = self.remote_path(remote_dir)
+        pairs = [(name, '{}/{}'.format(remote_dir.rstrip('/'), os.path.basename(name)))
+                 for name in local_files]
+        if self.cache is not None:
+            self.cache.invalidate(remote_dir)
+        return spread(self.session_pool(), (self.host, self.port, self.user, self.password),
+                      pairs, upload_files, max(self.segments, WORKERS), self.scheduler,
+                      self.compress and 'MODE Z' in self.features(), self.passive)
+
+    def reget(self, remote_file, local_file=None):
+        from .datapath import receive_to_file
+        from .tuning import ChunkSizer
+        from .journal import load_journal, save_journal, remove_journal, matches
+        if local_file is None:
+            local_file = os.path.join(os.getcwd(), os.path.basename(remote_file))
+        replies = self.transaction('TYPE I', 'SIZE ' + remote_file, 'MDTM ' + remote_file)
+        result = NUMBER_REG.match(replies[1])
+        if result is None:
+            raise FileNotFoundError('Couldn\'t download file {}'.format(remote_file))
+        file_size = int(result.group(1))
+        result = NUMBER_REG.match(replies[2])
+        modify = result.group(1) if result else None
+        offset = os.path.getsize(local_file) if os.path.exists(local_file) else 0
+        if offset and not matches(load_journal(local_file), remote=remote_file,
+                                  size=file_size, modify=modify):
+            self.say('Remote file has changed or partial file is unknown, starting over')
+            offset = 0
+        if offset > file_size:
+            offset = 0
+        save_journal(local_file, remote=remote_file, size=file_size, modify=modify)
+        reply = None
+        if offset < file_size:
+            # offsets of REST count plain bytes, resuming stays in MODE S
+            self.compressed(False)
+            commands = ('REST {}'.format(offset),) if offset else ()
+            channel, replies = self.open_data(*commands)
+            if offset and not replies[0].startswith('350'):
+                channel.close()
+                raise ConnectionError('Server cannot resume transfers: ' + replies[0])
+            data_sock, reply = self.start(channel, 'RETR', remote_file)
+            if data_sock is None:
+                raise FileNotFoundError('Couldn\'t download file {}'.format(remote_file))
+            transfer = self.progress(remote_file, file_size - offset)
+            sizer = ChunkSizer()
+            stream = self.open_stream()
+            try:
+                with open(local_file, 'ab' if offset else 'wb') as result:
+                    receive_to_file(data_sock, result, file_size - offset, transfer.update,
+                                    self.zero_copy, stream.throttle, sizer=sizer)
+                transfer.finish(self.tuning_report('get', sizer, data_sock))
+            finally:
+                stream.close()
+                data_sock.close()
+                reply = self.receive()
+            if not reply.startswith('2'):
+                raise TransferError('Download of {} failed, use reget to resume: {}'
+                                    .format(remote_file, reply.strip()), reply)
+        if os.path.getsize(local_file) != self.size(remote_file, False):
+            raise ConnectionError('Download of {} is incomplete, '
+                                  'use reget to resume'.format(remote_file))
+        remove_journal(local_file)
+        self.say('{} is complete'.format(local_file))
+        return reply
+
+    def reput(self, local_file, remote_name=None):
+        from .datapath import send_from_file
+        from .tuning import ChunkSizer
+        from .journal import load_journal, save_journal, remove_journal, local_state, matches
+        if remote_name is None:
+            remote_name = os.path.basename(local_file)
+        file_size = os.path.getsize(local_file)
+        state = local_state(local_file)
+        replies = self.transaction('TYPE I', 'SIZE ' + remote_name)
+        result = NUMBER_REG.match(replies[1])
+        offset = int(result.group(1)) if result else 0
+        if offset and not matches(load_journal(local_file), remote=remote_name, **state):
+            self.say('Local file has changed or remote file is unknown, starting over')
+            offset = 0
+        if offset > file_size:
+            offset = 0
+        save_journal(local_file, remote=remote_name, **state)
+        if self.cache is not None:
+            self.cache.invalidate_parent(self.remote_path(remote_name))
+        reply = None
+        if offset < file_size:
+            # offsets of REST count plain bytes, resuming stays in MODE S
+            self.compressed(False)
+            channel, replies = self.open_data()
+            reply = self.command('APPE' if offset else 'STOR', remote_name)
+            if offset and reply.startswith('5'):
+                # APPE is not available, REST + STOR does the same
+                reply = self.command('REST', offset)
+                if not reply.startswith('350'):
+                    channel.close()
+                    raise ConnectionError('Server cannot resume transfers: ' + reply)
+                reply = self.command('STOR', remote_name)
+            if not reply.startswith('150') and not reply.startswith('125'):
+                channel.close()
+                raise PermissionError('You have no permission to store {}: {}'
+                                      .format(remote_name, reply.strip()))
+            data_sock = self.accept(channel)
+            transfer = self.progress(local_file, file_size - offset)
+            sizer = ChunkSizer()
+            stream = self.open_stream()
+            try:
+                with open(local_file, 'rb') as file:
+                    send_from_file(data_sock, file, offset, file_size - offset, transfer.update,
+                                   self.zero_copy, stream.throttle, sizer=sizer)
+                transfer.finish(self.tuning_report('put', sizer, data_sock))
+            finally:
+                stream.close()
+                data_sock.close()
+                reply = self.receive()
+            if not reply.startswith('2'):
+                raise TransferError('Upload of {} failed, use reput to resume: {}'
+                                    .format(local_file, reply.strip()), reply)
+        if self.size(remote_name, False) != file_size:
+            raise ConnectionError('Upload of {} is incomplete, '
+                                  'use reput to resume'.format(local_file))
+        remove_journal(local_file)
+        self.say('{} is complete'.format(remote_name))
+        return reply
+
+    def fetch(self, path):
+        # small files such as checksum sidecars are read into memory, None if there is no such file
+        from .datapath import receive_to_file, receive_inflated
+        channel, replies = self.open_data('TYPE I')
+        compress = self.compressed()
+        data_sock, reply = self.start(channel, 'RETR', path)
+        if data_sock is None:
+            return None
+        result = io.BytesIO()
+        if compress:
+            receive_inflated(data_sock, result)
+        else:
+            receive_to_file(data_sock, result, zero_copy=False)
+        data_sock.close()
+        reply = self.receive()
+        return result.getvalue() if reply.startswith('2') else None
+
+    def check_digest(self, digest, expected, name):
+        actual = digest.hexdigest()
+        if expected is None:
+            self.say('No {} checksum to compare {} with, got {}'
+                     .format(digest.algorithm, name, actual))
+            return
+        if expected != actual:
+            raise ChecksumError('{} checksum of {} does not match: expected {}, got {}'
+                                .format(digest.algorithm, name, expected, actual),
+                                expected, actual)
+        self.say('{} checksum of {} is correct: {}'.format(digest.algorithm, name, actual))
+
+    def server_checksum(self, path, algorithm=None):
+        # HASH (with the algorithm chosen by OPTS) or one of the older X commands
+        from .checksum import parse_checksum, parse_hash, HASH_NAMES, X_COMMANDS
+        algorithm = algorithm or self.verify
+        supported = self.features()
+        if 'HASH' in supported:
+            if self.command('OPTS HASH', HASH_NAMES[algorithm]).startswith('2'):
+                reply = self.command('HASH', path)
+                if reply.startswith('2'):
+                    return parse_hash(reply[4:], algorithm)
+        if X_COMMANDS[algorithm] in supported:
+            reply = self.command(X_COMMANDS[algorithm], path)
+            if reply.startswith('2'):
+                return parse_checksum(reply[4:], algorithm)
+        return None
+
+    def remote_sidecar(self, path, algorithm=None):
+        from .checksum import parse_checksum, sidecar_name
+        algorithm = algorithm or self.verify
+        data = self.fetch(sidecar_name(path, algorithm))
+        return parse_checksum(data.decode('UTF-8', 'replace'), algorithm) if data else None
+
+    def listing(self, path=None):
+        from .listing import ListParser
+        from .datapath import receive_to_file, receive_inflated
+        path = self.remote_path(path)
+        entries = self.cache.get(path) if self.cache is not None else None
+        if entries is not None:
+            return entries
+        mlsd = 'MLST' in self.features()
+        compress = self.compressed()
+        channel, replies = self.open_data()
+        started = time.monotonic()
+        data_sock, reply = self.start(channel, 'MLSD' if mlsd else 'LIST', path)
+        if data_sock is None:
+            raise FileNotFoundError('Couldn\'t list directory {}'.format(path))
+        phase = self.metrics.data_phase('list', started)
+        # lines are parsed while the rest of the listing is still on its way
+        parser = ListParser(mlsd)
+        try:
+            if compress:
+                receive_inflated(data_sock, parser, phase)
+            else:
+                receive_to_file(data_sock, parser, progress=phase, zero_copy=False)
+            phase.finish()
+        finally:
+            data_sock.close()
+            reply = self.receive()
+        entries = parser.close()
+        # a listing cut short is not returned, let alone kept in the cache
+        if not reply.startswith('2'):
+            raise TransferError('Listing of {} failed after {} entries: {}'
+                                .format(path, len(entries), reply.strip()), reply)
+        if self.cache is not None:
+            self.cache.put(path, entries)
+        return entries
+
+    def cat(self, path, output):
+        # streams over a pooled session, nothing lands on disk and this session stays as it is
+        import shutil
+        from .stream import open_remote
+        from .datapath import CHUNK_SIZE
+        compress = self.compress and 'MODE Z' in self.features()
+        with self.session_pool().session(self.host, self.port, self.user,
+                                         self.password) as sock:
+            with open_remote(sock, self.remote_path(path), 'rb', compress,
+                             passive=self.passive) as remote:
+                shutil.copyfileobj(remote, output, CHUNK_SIZE)
+
+
+def local_sidecar(local_file, algorithm):
+    from .checksum import parse_checksum, sidecar_name
+    if not os.path.exists(sidecar_name(local_file, algorithm)):
+        return None
+    with open(sidecar_name(local_file, algorithm), 'r') as file:
+        return parse_checksum(file.read(), algorithm)
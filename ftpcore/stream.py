@@ -0,0 +1,93 @@
+import io
+import zlib
+from .reply import read_reply
+from .mirror import open_data, start_transfer
+from .datapath import CHUNK_SIZE, INFLATE_LIMIT
+
+
+class RemoteFile(io.RawIOBase):
+    # one RETR or STOR on a logged-in control connection, bytes go straight
+    # between the caller and the data socket; close() reads the completion reply
+
+    def __init__(self, sock, path, mode='rb', compress=False, passive=True):
+        if mode not in ('rb', 'wb'):
+            raise ValueError('Mode should be rb or wb, not {}'.format(mode))
+        super(RemoteFile, self).__init__()
+        self.sock = sock
+        self.name = path
+        self.mode = mode
+        self.query = ('RETR ' if mode == 'rb' else 'STOR ') + path
+        self.eof = False
+        self.pending = b''
+        self.inflate = zlib.decompressobj() if compress and mode == 'rb' else None
+        self.deflate = zlib.compressobj() if compress and mode == 'wb' else None
+        # set only once the transfer runs, a failed open has nothing to finish
+        self.data_sock = None
+        channel = open_data(sock, compress, 'TYPE I', passive=passive)
+        self.data_sock = start_transfer(sock, channel, self.query, passive)
+
+    def readable(self):
+        return self.mode == 'rb'
+
+    def writable(self):
+        return self.mode == 'wb'
+
+    def readinto(self, buffer):
+        if self.inflate is None:
+            count = self.data_sock.recv_into(buffer)
+            self.eof = not count
+            return count
+        while not self.pending and not self.eof:
+            data = self.inflate.unconsumed_tail or self.data_sock.recv(CHUNK_SIZE)
+            if data:
+                self.pending = self.inflate.decompress(data, INFLATE_LIMIT)
+                continue
+            self.pending = self.inflate.flush()
+            self.eof = True
+            if not self.inflate.eof:
+                raise ConnectionError('Compressed data of {} ended too early'.format(self.name))
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+    def write(self, data):
+        if self.deflate is not None:
+            self.data_sock.sendall(self.deflate.compress(data))
+        else:
+            self.data_sock.sendall(data)
+        return len(data)
+
+    def close(self):
+        if self.closed or self.data_sock is None:
+            super(RemoteFile, self).close()
+            return
+        try:
+            if self.deflate is not None:
+                self.data_sock.sendall(self.deflate.flush())
+            complete = self.mode == 'wb' or self.eof
+            self.data_sock.close()
+            # a download closed before EOF is refused by the server, that is expected
+            reply = read_reply(self.sock)
+            if complete and reply.code // 100 != 2:
+                raise ConnectionError('{} failed: {}'.format(self.query, reply))
+        finally:
+            super(RemoteFile, self).close()
+
+
+def open_remote(sock, path, mode='rb', compress=False, buffering=CHUNK_SIZE, passive=True):
+    # buffered like the built-in open(); wrap in io.TextIOWrapper for text
+    remote = RemoteFile(sock, path, mode, compress, passive)
+    if mode == 'rb':
+        return io.BufferedReader(remote, buffering)
+    return io.BufferedWriter(remote, buffering)
+
+
+def iter_remote(sock, path, size=CHUNK_SIZE, compress=False, passive=True):
+    # chunks of a remote file as they arrive; stopping early aborts the transfer cleanly
+    with RemoteFile(sock, path, 'rb', compress, passive) as remote:
+        while True:
+            data = remote.read(size)
+            if not data:
+                break
+            yield data
@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import time
+import queue
+import calendar
+import posixpath
+import threading
+from collections import namedtuple
+from .journal import JOURNAL_SUFFIX
+from .mirror import list_dir, download, upload, command, throttled, WORKERS
+
+STATE_FILE = '.ftpsync'
+KINDS = ('new', 'changed', 'deleted', 'unchanged')
+
+Action = namedtuple('Action', ['kind', 'path'])
+
+
+def remote_tree(sock, remote_dir, mlsd=False, cache=None, passive=True):
+    files = {}
+    folders = ['']
+    while folders:
+        folder = folders.pop()
+        path = posixpath.join(remote_dir, folder) if folder else remote_dir
+        for entry in list_dir(sock, path, mlsd, cache, passive=passive):
+            relative = posixpath.join(folder, entry.name) if folder else entry.name
+            if entry.type == 'dir':
+                folders.append(relative)
+            elif entry.type == 'file':
+                files[relative] = entry
+    return files
+
+
+def local_tree(local_dir):
+    files = {}
+    for root, dirs, names in os.walk(local_dir):
+        for name in names:
+            if name == STATE_FILE or name.endswith(JOURNAL_SUFFIX):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, local_dir).replace(os.sep, '/')
+            stat = os.stat(path)
+            files[relative] = (stat.st_size, int(stat.st_mtime))
+    return files
+
+
+def load_state(local_dir):
+    try:
+        with open(os.path.join(local_dir, STATE_FILE), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(local_dir, state):
+    os.makedirs(local_dir, exist_ok=True)
+    with open(os.path.join(local_dir, STATE_FILE), 'w') as file:
+        json.dump(state, file, indent=1, sort_keys=True)
+
+
+def record(local, entry):
+    return {'size': local[0], 'mtime': local[1],
+            'remote_size': entry.size, 'remote_modify': entry.modify}
+
+
+def modify_time(entry):
+    # only MLSD facts carry a usable timestamp
+    if entry.modify and re.match(r'\d{14}', entry.modify):
+        return calendar.timegm(time.strptime(entry.modify[:14], '%Y%m%d%H%M%S'))
+    return None
+
+
+def same(direction, local, entry, saved):
+    if saved is not None:
+        return saved == record(local, entry)
+    if local[0] != entry.size:
+        return False
+    remote_time = modify_time(entry)
+    if remote_time is None:
+        return True
+    return local[1] >= remote_time if direction == 'down' else remote_time >= local[1]
+
+
+def plan(direction, remote, local, state):
+    source, target = (remote, local) if direction == 'down' else (local, remote)
+    actions = []
+    for path in sorted(source):
+        if path not in target:
+            actions.append(Action('new', path))
+        elif same(direction, local[path], remote[path], state.get(path)):
+            actions.append(Action('unchanged', path))
+        else:
+            actions.append(Action('changed', path))
+    for path in sorted(target):
+        if path not in source:
+            actions.append(Action('deleted', path))
+    return actions
+
+
+def execute(pool, login, direction, remote_dir, local_dir, actions, delete, workers,
+            scheduler=None, passive=True):
+    tasks = queue.Queue()
+    lock = threading.Lock()
+    stats = {'files': 0, 'bytes': 0, 'done': [], 'errors': []}
+    for action in actions:
+        if action.kind in ('new', 'changed') or (action.kind == 'deleted' and delete):
+            tasks.put(action)
+
+    def handle(sock, action):
+        remote_file = posixpath.join(remote_dir, action.path)
+        local_file = os.path.join(local_dir, *action.path.split('/'))
+        if action.kind == 'deleted':
+            if direction == 'down':
+                os.remove(local_file)
+            else:
+                reply = command(sock, 'DELE ' + remote_file)
+                if reply.code // 100 != 2:
+                    raise PermissionError('Cannot delete {}: {}'.format(remote_file, reply))
+            return 0
+        if direction == 'down':
+            os.makedirs(os.path.dirname(local_file), exist_ok=True)
+            return throttled(scheduler, login[0], download, sock, remote_file, local_file,
+                             passive=passive)
+        return throttled(scheduler, login[0], upload, sock, local_file, remote_file,
+                         passive=passive)
+
+    def worker():
+        sock = None
+        while True:
+            try:
+                action = tasks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if sock is None:
+                    sock = pool.acquire(*login)
+                transferred = handle(sock, action)
+                with lock:
+                    stats['done'].append(action)
+                    stats['files'] += action.kind != 'deleted'
+                    stats['bytes'] += transferred
+            except Exception as error:
+                with lock:
+                    stats['errors'].append((action.path, error))
+                # a refused file leaves the session as it was, anything else may not have
+                if sock is not None and not isinstance(error, (FileNotFoundError,
+                                                               PermissionError)):
+                    pool.release(sock, broken=True)
+                    sock = None
+        if sock is not None:
+            pool.release(sock)
+
+    if direction == 'up':
+        make_dirs(pool, login, remote_dir, [action.path for action in actions
+                                            if action.kind in ('new', 'changed')])
+    threads = [threading.Thread(target=worker) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats
+
+
+def make_dirs(pool, login, remote_dir, paths):
+    folders = set()
+    for path in paths:
+        parts = path.split('/')[:-1]
+        for i in range(1, len(parts) + 1):
+            folders.add('/'.join(parts[:i]))
+    if not folders:
+        return
+    with pool.session(*login) as sock:
+        # 550 for folders that already exist is fine
+        for folder in sorted(folders):
+            command(sock, 'MKD ' + posixpath.join(remote_dir, folder))
+
+
+def sync(pool, login, direction, remote_dir, local_dir, dry_run=False, delete=False,
+         mlsd=False, cache=None, workers=WORKERS, scheduler=None, show_plan=None, passive=True):
+    # show_plan gets the planned actions before anything is transferred
+    if direction not in ('down', 'up'):
+        raise ValueError('Sync direction is either "down" or "up"')
+    start_time = time.time()
+    state = load_state(local_dir)
+    with pool.session(*login) as sock:
+        remote = remote_tree(sock, remote_dir, mlsd, cache, passive)
+    local = local_tree(local_dir) if os.path.isdir(local_dir) else {}
+    actions = plan(direction, remote, local, state)
+    if show_plan is not None:
+        show_plan(actions)
+    if dry_run:
+        return None
+    stats = execute(pool, login, direction, remote_dir, local_dir, actions, delete, workers,
+                    scheduler, passive)
+    if direction == 'up' and stats['done']:
+        if cache is not None:
+            for action in stats['done']:
+                cache.invalidate_parent(posixpath.join(remote_dir, action.path))
+        with pool.session(*login) as sock:
+            remote = remote_tree(sock, remote_dir, mlsd, cache, passive)
+    local = local_tree(local_dir) if os.path.isdir(local_dir) else {}
+    failed = set(path for path, error in stats['errors'])
+    for action in actions:
+        if action.path in failed or action.path not in local or action.path not in remote:
+            state.pop(action.path, None)
+        elif action.kind != 'deleted':
+            state[action.path] = record(local[action.path], remote[action.path])
+    save_state(local_dir, state)
+    stats['seconds'] = time.time() - start_time
+    return stats
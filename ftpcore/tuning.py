@@ -0,0 +1,121 @@
+import time
+import socket
+
+BUFFER_SIZE = 4 * 1024 * 1024
+MIN_CHUNK = 16 * 1024
+START_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+WINDOW = 0.05
+WINDOW_CALLS = 8
+# buffer sizes the kernel really gives, found out once on a scratch socket
+ACCEPTED = {}
+
+
+def tune_control(sock):
+    # commands and replies are small and sent whole, Nagle would only hold them back
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def accepted(option, size):
+    # a fixed buffer turns off the kernel's own autotuning (Linux), which is only
+    # worth it when the kernel grants the whole size; otherwise leave it alone
+    if (option, size) not in ACCEPTED:
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            probe.setsockopt(socket.SOL_SOCKET, option, size)
+            ACCEPTED[(option, size)] = probe.getsockopt(socket.SOL_SOCKET, option) >= size
+        except OSError:
+            ACCEPTED[(option, size)] = False
+        finally:
+            probe.close()
+    return ACCEPTED[(option, size)]
+
+
+def tune_data(sock, buffer_size=BUFFER_SIZE):
+    # before connect() or listen(), so that the window scale covers the buffers;
+    # returns what the sockets ended up with, None meaning left to the kernel
+    result = {}
+    for name, option in (('rcvbuf', socket.SO_RCVBUF), ('sndbuf', socket.SO_SNDBUF)):
+        result[name] = None
+        if buffer_size and accepted(option, buffer_size):
+            sock.setsockopt(socket.SOL_SOCKET, option, buffer_size)
+            result[name] = sock.getsockopt(socket.SOL_SOCKET, option)
+    return result
+
+
+class ChunkSizer:
+    # read/write size of one transfer. Reads that come back full mean data waits in
+    # the kernel, so the chunk doubles while throughput keeps up and falls back when
+    # it does not; reads that come back short mean the link is the limit, so the
+    # chunk shrinks to what actually arrives per call
+
+    def __init__(self, size=START_CHUNK, minimum=MIN_CHUNK, maximum=MAX_CHUNK):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.ceiling = maximum
+        self.largest = size
+        self.calls = 0
+        self.grown = False
+        self.best_rate = 0.0
+        self.reset_window(time.monotonic())
+
+    def reset_window(self, now):
+        self.window_start = now
+        self.window_calls = 0
+        self.window_full = 0
+        self.window_bytes = 0
+
+    def record(self, count, wanted):
+        self.calls += 1
+        self.window_calls += 1
+        self.window_bytes += count
+        if count >= wanted:
+            self.window_full += 1
+        now = time.monotonic()
+        if self.window_calls >= WINDOW_CALLS and now - self.window_start >= WINDOW:
+            self.adapt(self.window_bytes / (now - self.window_start))
+            self.reset_window(now)
+
+    def adapt(self, rate):
+        if self.window_full * 2 < self.window_calls:
+            average = self.window_bytes // self.window_calls
+            while self.size > self.minimum and self.size // 2 >= average:
+                self.size //= 2
+            self.grown = False
+        elif self.grown and rate < self.best_rate * 0.95:
+            # the last doubling did not pay off, stay below it
+            self.size = max(self.size // 2, self.minimum)
+            self.ceiling = self.size
+            self.grown = False
+        elif self.size < self.ceiling:
+            self.best_rate = max(self.best_rate, rate)
+            self.size = min(self.size * 2, self.ceiling)
+            self.largest = max(self.largest, self.size)
+            self.grown = True
+        else:
+            self.best_rate = max(self.best_rate, rate)
+
+    def summary(self):
+        return {'chunk': self.size, 'largest_chunk': self.largest, 'syscalls': self.calls}
+
+
+def connect_data(address, timeout=None, buffer_size=BUFFER_SIZE):
+    # socket.create_connection() for data connections, tuned before the handshake;
+    # the address is numeric, as EPSV and PASV give it
+    sock = socket.socket(socket.AF_INET6 if ':' in address[0] else socket.AF_INET,
+                         socket.SOCK_STREAM)
+    tune_data(sock, buffer_size)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def buffers(sock):
+    # what the kernel uses right now, autotuned or fixed
+    return {'rcvbuf': sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+            'sndbuf': sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)}
@@ -0,0 +1,33 @@
+import os
+import pytest
+from ftp_server import StandInServer
+
+
+@pytest.fixture
+def root(tmp_path):
+    # a small tree for the stand-in server
+    root = tmp_path / 'root'
+    (root / 'sub' / 'deeper').mkdir(parents=True)
+    (root / 'many').mkdir()
+    (root / 'up').mkdir()
+    (root / 'big.bin').write_bytes(os.urandom(300 * 1024))
+    (root / 'sub' / 'a.txt').write_bytes(b'first file\n')
+    (root / 'sub' / 'deeper' / 'b.txt').write_bytes(b'second file\n')
+    for number in range(1, 41):
+        (root / 'many' / 'f{}.txt'.format(number)).write_bytes(b'x' * number)
+    return root
+
+
+@pytest.fixture
+def serve(root):
+    # serve(*faults, **options) starts a StandInServer over root, stopped after the test
+    servers = []
+
+    def start(*faults, **options):
+        server = StandInServer(str(root), faults=faults, **options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from ftpcore.async_ftp import AsyncFTP, fan_out
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def connected(server):
+    client = AsyncFTP(*server.address)
+    await client.connect()
+    await client.login('anonymous', 'x')
+    return client
+
+
+@pytest.mark.parametrize('faults', [(), ('no_epsv',)])
+def test_get_put_and_list(serve, root, tmp_path, faults):
+    server = serve(*faults)
+
+    async def session():
+        client = await connected(server)
+        try:
+            assert await client.get('/big.bin', str(tmp_path / 'big.bin')) == 300 * 1024
+            await client.put(str(tmp_path / 'big.bin'), '/up/copy.bin')
+            listing = await client.list('/up')
+            return client.extended, listing
+        finally:
+            await client.quit()
+
+    extended, listing = run(session())
+    assert extended is not bool(faults)
+    assert 'copy.bin' in listing
+    assert (root / 'up' / 'copy.bin').read_bytes() == (root / 'big.bin').read_bytes()
+
+
+def test_refused_file_keeps_the_session(serve, tmp_path):
+    server = serve()
+
+    async def session():
+        client = await connected(server)
+        try:
+            with pytest.raises(FileNotFoundError):
+                await client.get('/missing.txt', str(tmp_path / 'missing.txt'))
+            with pytest.raises(FileNotFoundError):
+                await client.put(str(tmp_path / 'missing.txt'), '/up/missing.txt')
+            return await client.get('/sub/a.txt', str(tmp_path / 'a.txt'))
+        finally:
+            await client.quit()
+
+    assert run(session()) == len(b'first file\n')
+
+
+def test_fan_out_returns_failures_in_place(serve, tmp_path):
+    server = serve()
+
+    async def fetch(name):
+        client = await connected(server)
+        try:
+            return await client.get('/many/' + name, str(tmp_path / name))
+        finally:
+            await client.quit()
+
+    names = ['f{}.txt'.format(number) for number in range(1, 21)] + ['missing.txt']
+    results = run(fan_out(fetch, names, limit=5))
+    assert results[:20] == list(range(1, 21))
+    assert isinstance(results[20], FileNotFoundError)
@@ -0,0 +1,16 @@
+from ftpcore.checksum import parse_checksum, parse_hash
+
+
+def test_hash_reply_range_with_eight_digit_end():
+    reply = '213 CRC32 0-12000000 389e7ca1 big.bin'
+    assert parse_hash(reply[4:], 'crc32') == '389e7ca1'
+
+
+def test_hash_reply_other_algorithm():
+    assert parse_hash('SHA-256 0-12000000 {} big.bin'.format('ab' * 32), 'crc32') is None
+    assert parse_hash('SHA-256 0-12 {} big.bin'.format('AB' * 32), 'sha256') == 'ab' * 32
+
+
+def test_x_command_and_sidecar():
+    assert parse_checksum('389E7CA1', 'crc32') == '389e7ca1'
+    assert parse_checksum('{}  big.bin\n'.format('0f' * 16), 'md5') == '0f' * 16
@@ -0,0 +1,53 @@
+import socket
+import pytest
+from ftpcore import FTPSession, fxp
+
+
+def connect(server, timeout=3):
+    session = FTPSession(*server.address, timeout=timeout)
+    session.connect()
+    session.login('anonymous', 'x')
+    return session
+
+
+@pytest.mark.parametrize('source_faults, target_faults', [
+    ((), ('late_150',)),
+    (('late_150',), ('late_150',)),
+    # the target cannot listen, so the source does and answers 150 late
+    (('late_150',), ('refuse_pasv', 'late_150')),
+])
+def test_copy_between_servers(serve, root, source_faults, target_faults):
+    source = connect(serve(*source_faults))
+    target = connect(serve(*target_faults))
+    with source, target:
+        assert source.copy_to(target, '/big.bin', '/up/copy.bin') == 300 * 1024
+        assert (root / 'up' / 'copy.bin').read_bytes() == (root / 'big.bin').read_bytes()
+        source.verify = 'sha256'
+        assert source.copy_to(target, '/sub/a.txt', '/up/a.txt') == 11
+
+
+def test_refused_copy_leaves_both_sessions_usable(serve):
+    source = connect(serve())
+    target = connect(serve('late_150'))
+    with source, target:
+        with pytest.raises(FileNotFoundError):
+            source.copy_to(target, '/missing.bin')
+        with pytest.raises(PermissionError):
+            source.copy_to(target, '/big.bin', '/no/such/dir.bin')
+        assert source.pwd().startswith('257')
+        assert target.pwd().startswith('257')
+
+
+def test_copy_that_never_starts_is_aborted(serve, monkeypatch):
+    # the source is sent to a port nobody listens on, the target waits in vain
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        dead = probe.getsockname()
+    point = fxp.point
+    monkeypatch.setattr(fxp, 'point', lambda session, address: point(session, dead))
+    source = connect(serve(), timeout=1)
+    target = connect(serve('late_150'), timeout=1)
+    with source, target:
+        with pytest.raises(ConnectionError):
+            source.copy_to(target, '/big.bin', '/up/never.bin')
+        assert source.pwd().startswith('257')
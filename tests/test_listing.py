@@ -0,0 +1,82 @@
+import math
+import pytest
+from ftpcore import FTPSession, TransferError
+from ftpcore.listing import ListParser, DirCache, parse_list, parse_mlsd
+
+LIST_TEXT = (b'total 3\r\n'
+             b'-rw-r--r--   1 user  group      1234 Jun 20  2013 notes.txt\r\n'
+             b'drwxr-xr-x   2 user  group      4096 Jan  1  2020 docs\r\n'
+             b'lrwxrwxrwx   1 user  group         7 Mar  3  2021 latest -> docs\r\n'
+             b'-rw-r--r--   1 user  group         0 Feb  2  2019 name with spaces.txt\r\n')
+
+
+def test_parser_lines_cut_between_writes():
+    parser = ListParser()
+    for start in range(0, len(LIST_TEXT), 7):
+        parser.write(LIST_TEXT[start:start + 7])
+    listing = parser.close()
+    assert [(entry.name, entry.type, entry.size) for entry in listing] == [
+        ('notes.txt', 'file', 1234), ('docs', 'dir', 4096), ('latest', 'link', 7),
+        ('name with spaces.txt', 'file', 0)]
+
+
+def test_last_line_without_newline():
+    parser = ListParser(mlsd=True)
+    parser.write(b'type=cdir; .\r\ntype=file;size=5;modify=20200101120000; a.txt')
+    listing = parser.close()
+    assert len(listing) == 1
+    assert listing[0] == ('a.txt', 'file', 5, '20200101120000', None)
+    assert listing.mtimes[0] == 1577880000.0
+
+
+def test_dos_listing():
+    listing = parse_list('06-20-13  01:45PM       <DIR>          docs\r\n'
+                         '06-20-13  01:45PM                 1234 notes.txt\r\n')
+    assert [(entry.name, entry.type, entry.size) for entry in listing] == [
+        ('docs', 'dir', 0), ('notes.txt', 'file', 1234)]
+
+
+def test_filter_sort_and_find():
+    listing = parse_mlsd('type=file;size=30;modify=20200101000000; b.log\n'
+                         'type=file;size=10;modify=20210101000000; a.txt\n'
+                         'type=dir;modify=20190101000000; logs\n'
+                         'type=file;modify=20220101000000; unknown.bin\n')
+    assert [entry.name for entry in listing.sort('size')] == ['logs', 'unknown.bin', 'a.txt',
+                                                              'b.log']
+    assert [entry.name for entry in listing.sort('time', reverse=True)][0] == 'unknown.bin'
+    assert [entry.name for entry in listing.filter(kind='file', min_size=20)] == ['b.log']
+    assert [entry.name for entry in listing.filter(pattern='*.txt')] == ['a.txt']
+    assert [entry.name for entry in listing.filter(newer=1577836800, max_size=100)] == [
+        'b.log', 'a.txt']
+    assert listing.find('logs').type == 'dir'
+    assert listing.find('missing') is None
+    assert listing.total_size() == 40
+    assert len(parse_list('garbage line\n')) == 0
+    assert math.isnan(parse_mlsd('type=file;size=1; undated\n').mtimes[0])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_session_listing(serve, compress):
+    server = serve()
+    with FTPSession(*server.address, cache=DirCache()) as session:
+        session.compress = compress
+        session.connect()
+        session.login('anonymous', 'x')
+        listing = session.listing('/many')
+        assert len(listing) == 40
+        assert listing.find('f7.txt').size == 7
+        assert session.cache.get('/many') is listing
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_listing_cut_short_is_not_cached(serve, compress):
+    server = serve('drop_data', drop_after=100)
+    with FTPSession(*server.address, cache=DirCache()) as session:
+        session.compress = compress
+        session.connect()
+        session.login('anonymous', 'x')
+        with pytest.raises((TransferError, ConnectionError)):
+            session.listing('/many')
+        assert session.cache.get('/many') is None
+        # the completion reply has been read, the next command gets its own
+        assert session.pwd().startswith('257')
@@ -0,0 +1,45 @@
+import pytest
+from ftpcore.network import split_host, passive_address, passive_command, refused_epsv
+
+
+class Control:
+    # the parts of a control socket passive_address() looks at
+    family = 2
+
+    def getpeername(self):
+        return '192.0.2.7', 21
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('ftp.example.com', ('ftp.example.com', 21)),
+    ('ftp.example.com:2121', ('ftp.example.com', 2121)),
+    ('192.0.2.1:990', ('192.0.2.1', 990)),
+    ('[::1]:2121', ('::1', 2121)),
+    ('[2001:db8::1]', ('2001:db8::1', 21)),
+    ('2001:db8::1', ('2001:db8::1', 21)),
+])
+def test_split_host(text, expected):
+    assert split_host(text, 21) == expected
+
+
+def test_split_host_bad_port():
+    with pytest.raises(ValueError):
+        split_host('host:ftp', 21)
+
+
+def test_passive_replies():
+    control = Control()
+    assert passive_command(control) == 'EPSV'
+    assert passive_address(control, '229 Entering Extended Passive Mode (|||40123|)') == \
+        ('192.0.2.7', 40123)
+    assert passive_address(control, '227 Entering Passive Mode (10,0,0,5,156,64).') == \
+        ('10.0.0.5', 40000)
+    with pytest.raises(ConnectionError):
+        passive_address(control, '425 Cannot open passive connection')
+
+
+def test_refused_epsv_switches_to_pasv():
+    control = Control()
+    assert not refused_epsv(control, '229 Entering Extended Passive Mode (|||40123|)')
+    assert refused_epsv(control, '500 EPSV not understood')
+    assert passive_command(control) == 'PASV'
@@ -0,0 +1,100 @@
+import time
+import pytest
+from ftpcore.pool import ConnectionPool
+from ftpcore.mirror import download, upload
+from ftpcore.reply import state_of, transaction
+
+
+def test_released_session_is_reused(serve):
+    server = serve()
+    pool = ConnectionPool(timeout=2)
+    sock = pool.acquire(*server.address, 'anonymous', 'x')
+    pool.release(sock)
+    assert pool.acquire(*server.address, 'anonymous', 'x') is sock
+    # another login is another session
+    other = pool.acquire(*server.address, 'someone', 'x')
+    assert other is not sock
+    pool.close()
+
+
+def test_idle_session_is_evicted(serve):
+    server = serve()
+    pool = ConnectionPool(timeout=2, idle_timeout=0.1)
+    sock = pool.acquire(*server.address, 'anonymous', 'x')
+    pool.release(sock)
+    time.sleep(0.2)
+    fresh = pool.acquire(*server.address, 'anonymous', 'x')
+    assert fresh is not sock
+    assert sock.fileno() == -1
+    pool.close()
+
+
+def test_broken_session_is_closed(serve):
+    server = serve()
+    pool = ConnectionPool(timeout=2)
+    sock = pool.acquire(*server.address, 'anonymous', 'x')
+    pool.release(sock, broken=True)
+    assert sock.fileno() == -1
+    assert pool.acquire(*server.address, 'anonymous', 'x') is not sock
+    pool.close()
+
+
+def test_sessions_per_host_are_limited(serve):
+    server = serve()
+    pool = ConnectionPool(max_per_host=1, timeout=2)
+    sock = pool.acquire(*server.address, 'anonymous', 'x')
+    with pytest.raises(ConnectionError):
+        pool.acquire(*server.address, 'anonymous', 'x', timeout=0.1)
+    pool.release(sock)
+    assert pool.acquire(*server.address, 'anonymous', 'x', timeout=0.1) is sock
+    pool.close()
+
+
+def test_bad_login_gives_the_slot_back(serve):
+    server = serve('bad_login')
+    pool = ConnectionPool(max_per_host=1, timeout=2)
+    for attempt in range(2):
+        with pytest.raises(ValueError):
+            pool.acquire(*server.address, 'anonymous', 'x', timeout=0.1)
+    pool.close()
+
+
+def test_refused_file_keeps_the_session(serve, root, tmp_path):
+    server = serve()
+    pool = ConnectionPool(timeout=2)
+    with pytest.raises(FileNotFoundError):
+        with pool.session(*server.address, 'anonymous', 'x') as sock:
+            download(sock, '/missing.bin', str(tmp_path / 'missing.bin'))
+    with pytest.raises(PermissionError):
+        with pool.session(*server.address, 'anonymous', 'x') as again:
+            assert again is sock
+            upload(again, str(root / 'big.bin'), '/no/such/dir.bin')
+    assert pool.acquire(*server.address, 'anonymous', 'x') is sock
+    pool.close()
+
+
+def test_failed_data_connection_drops_the_session(serve, tmp_path):
+    server = serve('refuse_pasv')
+    pool = ConnectionPool(timeout=2)
+    with pytest.raises(ConnectionError):
+        with pool.session(*server.address, 'anonymous', 'x') as sock:
+            download(sock, '/big.bin', str(tmp_path / 'big.bin'))
+    assert sock.fileno() == -1
+    pool.close()
+
+
+def test_lockstep_is_remembered_per_server(serve):
+    server = serve('no_pipelining')
+    pool = ConnectionPool(timeout=1)
+    first = pool.acquire(*server.address, 'anonymous', 'x')
+    transaction(first, ['TYPE I', 'PWD'])
+    assert state_of(first).pipelining is False
+    pool.release(first)
+    pool.acquire(*server.address, 'anonymous', 'x')
+    second = pool.acquire(*server.address, 'anonymous', 'x')
+    assert second is not first
+    # found out by the first session, the second does not wait for a timeout
+    started = time.monotonic()
+    assert [reply.code for reply in transaction(second, ['TYPE I', 'PWD'])] == [200, 257]
+    assert time.monotonic() - started < 0.5
+    pool.close()
@@ -0,0 +1,73 @@
+import pytest
+from ftpcore.reply import ReplyReader, transaction, state_of
+from ftpcore.pool import ConnectionPool
+
+
+class Packets:
+    # stands in for a socket that delivers the given pieces, then end of stream
+    def __init__(self, *packets):
+        self.packets = list(packets)
+
+    def recv(self, size):
+        return self.packets.pop(0) if self.packets else b''
+
+
+def test_reply_split_across_packets():
+    reader = ReplyReader(Packets(b'22', b'0 Rea', b'dy\r', b'\n'))
+    reply = reader.read_reply()
+    assert reply.code == 220
+    assert reply.lines == ['220 Ready']
+
+
+def test_multi_line_reply_and_the_one_behind_it():
+    data = b'211-Features:\r\n MDTM\r\n211-not the end yet\r\n SIZE\r\n211 End\r\n200 Next\r\n'
+    reader = ReplyReader(Packets(data[:30], data[30:]))
+    reply = reader.read_reply()
+    assert reply.code == 211
+    assert reply.lines == ['211-Features:', ' MDTM', '211-not the end yet', ' SIZE', '211 End']
+    assert reader.pending() == 1
+    assert str(reader.read_reply()) == '200 Next\r\n'
+
+
+def test_garbage_before_a_reply_is_kept_with_it():
+    reader = ReplyReader(Packets(b'hello\r\n230 Logged in\r\n'))
+    assert reader.read_reply().lines == ['hello', '230 Logged in']
+
+
+def test_connection_closed_in_the_middle_of_a_reply():
+    reader = ReplyReader(Packets(b'150-Opening\r\n'))
+    with pytest.raises(ConnectionError):
+        reader.read_reply()
+
+
+def test_transaction_pipelines(serve):
+    server = serve()
+    pool = ConnectionPool(timeout=2)
+    with pool.session(*server.address, 'anonymous', 'x') as sock:
+        replies = transaction(sock, ['TYPE I', 'SIZE /big.bin', 'PWD'])
+        assert [reply.code for reply in replies] == [200, 213, 257]
+        assert state_of(sock).pipelining is True
+    pool.close()
+
+
+@pytest.mark.parametrize('fault', ['no_pipelining', 'reject_pipelining'])
+def test_transaction_falls_back_to_lockstep(serve, fault):
+    server = serve(fault)
+    pool = ConnectionPool(timeout=1)
+    with pool.session(*server.address, 'anonymous', 'x') as sock:
+        replies = transaction(sock, ['TYPE I', 'SIZE /big.bin', 'PWD'])
+        assert [reply.code for reply in replies] == [200, 213, 257]
+        assert state_of(sock).pipelining is False
+        replies = transaction(sock, ['SIZE /sub/a.txt', 'NOOP'])
+        assert [reply.code for reply in replies] == [213, 200]
+    pool.close()
+
+
+def test_unknown_command_does_not_mean_lockstep(serve):
+    server = serve()
+    pool = ConnectionPool(timeout=2)
+    with pool.session(*server.address, 'anonymous', 'x') as sock:
+        replies = transaction(sock, ['TYPE I', 'BOGUS', 'PWD'])
+        assert [reply.code for reply in replies] == [200, 502, 257]
+        assert state_of(sock).pipelining is True
+    pool.close()
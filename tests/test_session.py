@@ -0,0 +1,68 @@
+import os
+import pytest
+from ftpcore import FTPSession, TransferError
+from ftpcore.journal import load_journal
+from ftpcore.stream import open_remote
+
+
+def connect(server, **options):
+    session = FTPSession(*server.address, **options)
+    session.connect()
+    session.login('anonymous', 'x')
+    return session
+
+
+@pytest.mark.parametrize('compress', [False, True])
+@pytest.mark.parametrize('passive', [False, True])
+def test_get_and_put(serve, root, tmp_path, compress, passive):
+    server = serve()
+    with connect(server, passive=passive) as session:
+        session.compress = compress
+        session.get('/big.bin', str(tmp_path / 'big.bin'))
+        assert (tmp_path / 'big.bin').read_bytes() == (root / 'big.bin').read_bytes()
+        session.put(str(tmp_path / 'big.bin'), '/up/copy.bin')
+        assert (root / 'up' / 'copy.bin').read_bytes() == (root / 'big.bin').read_bytes()
+        assert not os.path.exists(str(tmp_path / 'big.bin') + '.ftpjournal')
+
+
+def test_active_mode_without_passive(serve, root, tmp_path):
+    server = serve('refuse_pasv')
+    with connect(server, passive=False) as session:
+        session.segments = 2
+        session.get('/big.bin', str(tmp_path / 'big.bin'))
+        assert (tmp_path / 'big.bin').read_bytes() == (root / 'big.bin').read_bytes()
+        assert len(session.get_many(['/sub/a.txt', '/many/f3.txt'], str(tmp_path))
+                   ['errors']) == 0
+
+
+def test_broken_get_is_resumed_by_reget(serve, root, tmp_path):
+    local_file = str(tmp_path / 'big.bin')
+    with connect(serve('drop_data'), passive=True) as session:
+        session.compress = False
+        with pytest.raises(TransferError):
+            session.get('/big.bin', local_file)
+        assert 0 < os.path.getsize(local_file) < len((root / 'big.bin').read_bytes())
+        assert load_journal(local_file)['remote'] == '/big.bin'
+    with connect(serve()) as session:
+        assert session.reget('/big.bin', local_file).startswith('226')
+    assert (tmp_path / 'big.bin').read_bytes() == (root / 'big.bin').read_bytes()
+    assert load_journal(local_file) is None
+
+
+def test_stream_and_session_share_the_transfer_mode(serve, root, tmp_path):
+    server = serve()
+    with connect(server) as session:
+        with open_remote(session.sock, '/big.bin', 'rb', compress=True) as remote:
+            assert remote.read() == (root / 'big.bin').read_bytes()
+        session.compress = False
+        session.get('/big.bin', str(tmp_path / 'big.bin'))
+        assert (tmp_path / 'big.bin').read_bytes() == (root / 'big.bin').read_bytes()
+
+
+def test_refused_files(serve, root, tmp_path):
+    with connect(serve()) as session:
+        with pytest.raises(FileNotFoundError):
+            session.get('/missing.bin', str(tmp_path / 'missing.bin'))
+        with pytest.raises(PermissionError):
+            session.put(str(root / 'big.bin'), '/no/such/dir.bin')
+        assert session.pwd().startswith('257')
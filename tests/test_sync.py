@@ -0,0 +1,51 @@
+import os
+from ftpcore.listing import Entry
+from ftpcore.pool import ConnectionPool
+from ftpcore.sync import plan, record, sync
+
+
+def entry(size, modify=None):
+    return Entry('name', 'file', size, modify, None)
+
+
+def kinds(actions):
+    return dict((action.path, action.kind) for action in actions)
+
+
+def test_plan_down():
+    remote = {'new.txt': entry(3), 'same.txt': entry(5, '20200101000000'),
+              'grown.txt': entry(9), 'older.txt': entry(2, '20200101000000')}
+    local = {'same.txt': (5, 1600000000), 'grown.txt': (4, 0), 'older.txt': (2, 1000),
+             'gone.txt': (1, 0)}
+    assert kinds(plan('down', remote, local, {})) == {
+        'new.txt': 'new', 'same.txt': 'unchanged', 'grown.txt': 'changed',
+        'older.txt': 'changed', 'gone.txt': 'deleted'}
+
+
+def test_plan_up_and_saved_state():
+    remote = {'a.txt': entry(5, '20200101000000'), 'b.txt': entry(5, '20200101000000')}
+    local = {'a.txt': (5, 1), 'b.txt': (5, 1), 'c.txt': (1, 1)}
+    # what was recorded after the last sync wins over sizes and dates
+    state = {'a.txt': record(local['a.txt'], remote['a.txt']),
+             'b.txt': record((5, 2), remote['b.txt'])}
+    assert kinds(plan('up', remote, local, state)) == {
+        'a.txt': 'unchanged', 'b.txt': 'changed', 'c.txt': 'new'}
+
+
+def test_sync_down_then_nothing_to_do(serve, tmp_path):
+    server = serve()
+    pool = ConnectionPool(timeout=2)
+    login = server.address + ('anonymous', 'x')
+    local_dir = str(tmp_path / 'copy')
+    stats = sync(pool, login, 'down', '/sub', local_dir, mlsd=True)
+    assert stats['errors'] == []
+    assert stats['files'] == 2
+    with open(os.path.join(local_dir, 'deeper', 'b.txt'), 'rb') as file:
+        assert file.read() == b'second file\n'
+    stats = sync(pool, login, 'down', '/sub', local_dir, mlsd=True)
+    assert stats['files'] == 0
+    planned = []
+    assert sync(pool, login, 'down', '/sub', local_dir, True, mlsd=True,
+                show_plan=planned.extend) is None
+    assert set(action.kind for action in planned) == {'unchanged'}
+    pool.close()